@@ -1,38 +1,132 @@
+import os
+import sys
+import threading
+import time
 import uuid
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from collections import deque
+from typing import Dict, Any, Optional, List, NamedTuple
 
 from app.prompts.prompts import CustomerSupportPrompts
-from app.llm import llm
+from app.llm import get_llm, ResponseStream
+from app.relevance import RelevanceClassifier
+from app.sessions import SessionStore, SQLiteSessionStore
+from app.agents.flow import ConversationFlow, INITIAL_STAGE
+from app.intents import IntentMatcher
+from app.prefetch import Prefetcher
+from app.scheduler import PRIORITY_BACKGROUND
+from app import runtime
+from app.budgets import turn_budget, within
+from app.metrics import STAGE_LATENCY, registry
+from app.transcripts import TranscriptSink
+
+class Message(NamedTuple):
+    role: str
+    content: str
+    timestamp: float
 
 class ConversationContext:
-    def __init__(self, session_id: str, category: str):
+    __slots__ = ("session_id", "selected_category", "stage", "collected_items",
+                 "conversation_history", "payment_option", "streaming", "message_count", "followup", "prefetched")
+    
+    def __init__(self, session_id: str, category: str, history_limit: Optional[int] = None):
         self.session_id = session_id
-        self.selected_category = category
-        self.stage = "initial"
+        self.selected_category = sys.intern(category)
+        self.stage = INITIAL_STAGE
         self.collected_items = ""
-        self.conversation_history = []
+        # With a limit the history becomes a ring buffer that keeps only the latest messages
+        self.conversation_history = deque(maxlen=history_limit) if history_limit else []
         self.payment_option = "" 
+        self.streaming = False
+        self.message_count = 0
+        # Follow-up message waiting for the client to collect it, persisted with the session
+        self.followup: Optional[str] = None
+        # Speculatively generated replies for the next turn, see Prefetcher
+        self.prefetched = None
+    
+    def add_message(self, role: str, content: str):
+        """Append a message with an interned role and an epoch timestamp"""
+        self.conversation_history.append(Message(sys.intern(role), content, time.time()))
+        self.message_count += 1
+    
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], messages: List[tuple], history_limit: Optional[int] = None) -> "ConversationContext":
+        """Rebuild a context loaded from a persistent session store"""
+        context = cls(record["session_id"], record["category"], history_limit)
+        context.stage = sys.intern(record["stage"])
+        context.collected_items = record["collected_items"]
+        context.payment_option = record["payment_option"]
+        context.conversation_history.extend(Message(sys.intern(role), content, ts) for role, content, ts in messages)
+        context.message_count = record["message_count"]
+        context.followup = record.get("followup")
+        return context
 
 class CustomerSupportAgent:
     def __init__(self):
-        self.sessions: Dict[str, ConversationContext] = {}
         self.prompts = CustomerSupportPrompts()
+        self.relevance = RelevanceClassifier()
+        self.history_limit = int(os.getenv("HISTORY_LIMIT", "0")) or None
+        self.sessions = self._create_session_store()
+        self.flow = ConversationFlow(self.prompts, self)
+        self.intents = IntentMatcher(self.prompts.INTENT_KEYWORDS, self.prompts.INTENT_WEIGHTS)
+        self.prefetcher = Prefetcher(self._prefetch)
+        self.prefetch_enabled = os.getenv("PREFETCH", "1") == "1"
+        # Seconds a turn's LLM calls may take in total before it is answered with the fallback line
+        self.turn_budget = float(os.getenv("TURN_BUDGET", "8.0")) or None
+        registry.gauge("active_sessions", "Conversations held in the session store", callback=lambda: len(self.sessions))
+        # Archive of finished and in-progress conversations; TRANSCRIPT_DIR unset disables it
+        transcript_dir = os.getenv("TRANSCRIPT_DIR", "")
+        self.transcripts = TranscriptSink(
+            transcript_dir,
+            max_queue=int(os.getenv("TRANSCRIPT_QUEUE", "10000")),
+            segment_bytes=int(os.getenv("TRANSCRIPT_SEGMENT_MB", "64")) * 1024 * 1024,
+            enabled=bool(transcript_dir)
+        )
+        self.sessions.add_evict_hook(self._archive_evicted)
     
-    def start_conversation(self, category: str) -> Dict[str, Any]:
+    def _create_session_store(self) -> SessionStore:
+        """Build the session registry selected by SESSION_BACKEND ("memory" or "sqlite")"""
+        idle_ttl = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+        max_sessions = int(os.getenv("SESSION_MAX", "10000"))
+        
+        if os.getenv("SESSION_BACKEND", "memory") == "sqlite":
+            return SQLiteSessionStore(
+                os.getenv("SESSION_DB_PATH", "sessions.db"),
+                restore=lambda record, messages: ConversationContext.from_record(record, messages, self.history_limit),
+                idle_ttl=idle_ttl,
+                max_sessions=max_sessions,
+                history_limit=self.history_limit,
+                recheck_interval=float(os.getenv("SESSION_RECHECK_SECONDS", "1.0"))
+            )
+        
+        return SessionStore(idle_ttl=idle_ttl, max_sessions=max_sessions)
+    
+    def _save(self, context: ConversationContext, outcome: Optional[str] = None):
+        """Persist a session after it changed and archive its new messages, and its end once it has an outcome"""
+        self.sessions.save(context)
+        if outcome is None:
+            self.transcripts.record(context)
+        else:
+            self.transcripts.end(context, outcome)
+    
+    def _archive_evicted(self, context: ConversationContext, reason: str):
+        if reason == "capacity" and isinstance(self.sessions, SQLiteSessionStore):
+            # Only pushed out of the hot cache; it is archived as abandoned if it idles out in the database
+            return
+        self.transcripts.end(context, "abandoned" if reason == "idle" else "evicted")
+    
+    async def astart_conversation(self, category: str) -> Dict[str, Any]:
         """Start new conversation with category"""
         session_id = str(uuid.uuid4())
         
-        context = ConversationContext(session_id, category)
-        self.sessions[session_id] = context
+        context = ConversationContext(session_id, category, self.history_limit)
+        self.sessions.add(session_id, context)
         
         template = self.prompts.CATEGORY_TEMPLATES[category]
         behavior = self.prompts.UI_BEHAVIOR[category]
         
-        context.conversation_history.extend([
-            {"role": "user", "content": category, "timestamp": datetime.now()},
-            {"role": "assistant", "content": template, "timestamp": datetime.now()}
-        ])
+        context.add_message("user", category)
+        context.add_message("assistant", template)
+        self._save(context, "escalated" if behavior.get("needs_escalation") else None)
         
         result = {
             "success": True,
@@ -41,416 +135,401 @@ class CustomerSupportAgent:
             **behavior
         }
         
-        if category == "Payment and billing related query":
+        if behavior.get("show_payment_buttons"):
             result["buttons"] = self.prompts.PAYMENT_OPTIONS
         
         return result
     
-    def process_input(self, session_id: str, user_input: str) -> Dict[str, Any]:
+    def _format_prompt(self, prompt_key: str, **variables) -> str:
+        """Fill the AI prompt template for a prompt key"""
+        prompt = self.prompts.AI_PROMPTS[prompt_key]
+        return prompt.format(**variables) if variables else prompt
+    
+    async def _generate(self, prompt_key: str, **variables) -> str:
+        """Generate the AI response for a prompt key"""
+        return await get_llm().agenerate_response(self._format_prompt(prompt_key, **variables), prompt_key=prompt_key)
+    
+    async def _generate_batch(self, context: ConversationContext, requests: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """Generate replies for several prompt keys in one LLM round-trip, using prefetched ones first"""
+        texts = {}
+        for prompt_key, variables in requests.items():
+            text = await self.prefetcher.take(context, prompt_key, variables)
+            if text is not None:
+                texts[prompt_key] = text
+        
+        prompts = {key: self._format_prompt(key, **variables) for key, variables in requests.items() if key not in texts}
+        if prompts:
+            texts.update(await get_llm().agenerate_batch(prompts))
+        
+        return texts
+    
+    async def _prefetch(self, prompt_key: str, **variables) -> str:
+        """Generate a speculative reply behind every call a customer is waiting on"""
+        prompt = self._format_prompt(prompt_key, **variables)
+        return await within(None, get_llm().agenerate_response(prompt, prompt_key=prompt_key, priority=PRIORITY_BACKGROUND))
+    
+    async def _reply(self, context: ConversationContext, prompt_key: str, prefix: str = "", suffix: str = "",
+                     follow_up: Optional[List[str]] = None, text: Optional[str] = None, **variables) -> Dict[str, Any]:
+        """Generate an assistant reply, record it in the history and return the message fields of the result
+        
+        On streaming turns the result carries a ResponseStream under "stream" and "message" is None;
+        the reply is recorded once the stream has been consumed. A text generated beforehand is used as is.
+        """
+        
+        def record(text: str):
+            for content in [text] + (follow_up or []):
+                context.add_message("assistant", content)
+        
+        if text is None:
+            text = await self.prefetcher.take(context, prompt_key, variables)
+        
+        if text is None:
+            if context.streaming:
+                prompt = self._format_prompt(prompt_key, **variables)
+                return {"message": None, "stream": ResponseStream(prompt, prompt_key, prefix, suffix, record)}
+            
+            text = await self._generate(prompt_key, **variables)
+        
+        record(text)
+        
+        return {"message": f"{prefix}{text}{suffix}"}
+    
+    def _start_followup(self, context: ConversationContext, text: str) -> Dict[str, Any]:
+        """Keep a second message, generated with the current reply, on the session until it is collected"""
+        context.followup = text
+        return {"next_message_pending": True}
+    
+    async def acollect_followup(self, session_id: str) -> Dict[str, Any]:
+        """Return the pending follow-up message of a session and record it"""
+        
+        context = self.sessions.get(session_id)
+        if context is None:
+            return self._missing_session(session_id)
+        
+        message, context.followup = context.followup, None
+        if message is None:
+            return {"success": False, "error": "No follow-up message pending"}
+        
+        context.add_message("assistant", message)
+        self._save(context)
+        
+        return {"success": True, "message": message}
+    
+    def _missing_session(self, session_id: str) -> Dict[str, Any]:
+        """Result for a turn against a session that is not live"""
+        if self.sessions.is_expired(session_id):
+            return {"success": False, "error": "Session expired", "expired": True}
+        return {"success": False, "error": "Session not found"}
+    
+    async def aprocess_input(self, session_id: str, user_input: str, stream: bool = False) -> Dict[str, Any]:
         """Process user input based on conversation stage"""
         
-        if session_id not in self.sessions:
-            return {"success": False, "error": "Session not found"}
-        
-        context = self.sessions[session_id]
-        
-        context.conversation_history.append({
-            "role": "user", 
-            "content": user_input, 
-            "timestamp": datetime.now()
-        })
-        
-        if context.stage == "initial":
-            return self._handle_items_input(context, user_input)
-        elif context.stage == "photo_requested":
-            return self._handle_photo_response(context, user_input)
-        elif context.stage == "additional_info":
-            return self._handle_additional_info(context, user_input)
-        elif context.stage == "resolution_choice":
-            return self._handle_resolution_choice(context, user_input)
-        elif context.stage == "final_resolution":
-            return self._handle_final_resolution(context, user_input)
-        elif context.stage == "general_chat":
-            return self._handle_general_chat(context, user_input)
-        elif context.stage == "payment_response":
-            return self._handle_payment_followup(context, user_input)
+        context = self.sessions.get(session_id)
+        if context is None:
+            return self._missing_session(session_id)
+        
+        context.streaming = stream
+        
+        context.add_message("user", user_input)
+        
+        stage = context.stage
+        handler = self.flow.handler(stage)
+        if handler is not None:
+            started = time.perf_counter()
+            with turn_budget(self.turn_budget):
+                result = await handler(context, user_input)
+            STAGE_LATENCY.observe(time.perf_counter() - started, stage)
         else:
-            return {"success": True, "message": "I'm here to help with your order issues.", "show_chat": True}
+            result = {"success": True, "message": "I'm here to help with your order issues.", "show_chat": True}
+        
+        self._end_turn(context, result)
+        return result
     
-    def _handle_payment_button(self, session_id: str, button_text: str) -> Dict[str, Any]:
+    def _end_turn(self, context: ConversationContext, result: Dict[str, Any]):
+        """Save the session, archive it if it finished and prefetch what its stage will need"""
+        outcome = "resolved" if result.get("resolved") else "escalated" if result.get("escalated") else None
+        if self.prefetch_enabled:
+            self.prefetcher.replan(context, [] if outcome else self.flow.prefetch_plan(context))
+        
+        stream = result.get("stream")
+        if stream is None:
+            self._save(context, outcome)
+            return
+        
+        # A streamed reply lands in the history once consumed, so the turn is saved (and ended) again then
+        self._save(context)
+        record = stream.on_complete
+        
+        def complete(text: str):
+            record(text)
+            self._save(context, outcome)
+        
+        stream.on_complete = complete
+    
+    async def _ahandle_payment_button(self, session_id: str, button_text: str, stream: bool = False) -> Dict[str, Any]:
         """Handle payment option button clicks"""
         
-        if session_id not in self.sessions:
-            return {"success": False, "error": "Session not found"}
+        context = self.sessions.get(session_id)
+        if context is None:
+            return self._missing_session(session_id)
         
-        context = self.sessions[session_id]
-        context.stage = "payment_response"
+        step = self.flow.step(context, "payment_answered")
         context.payment_option = button_text 
+        context.streaming = stream
         
-        context.conversation_history.append({
-            "role": "user",
-            "content": button_text,
-            "timestamp": datetime.now()
-        })
-        
-        if "refund status" in button_text.lower():
-            prompt_key = "payment_refund_status"
-        elif "payment failure" in button_text.lower():
-            prompt_key = "payment_failure"
-        elif "invoice" in button_text.lower():
-            prompt_key = "payment_invoice"
-        elif "bill-related" in button_text.lower():
-            prompt_key = "payment_bill_issues"
-        elif "coupon did not work" in button_text.lower():
-            prompt_key = "payment_coupon_not_work"
-        else:
-            prompt_key = "payment_refund_status"
-        
-        ai_prompt = self.prompts.AI_PROMPTS[prompt_key]
-        response = llm.generate_response(ai_prompt)
+        context.add_message("user", button_text)
         
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now()
-        })
+        started = time.perf_counter()
+        with turn_budget(self.turn_budget):
+            reply = await self._reply(context, self.flow.payment(button_text).prompt_key)
+        STAGE_LATENCY.observe(time.perf_counter() - started, "payment_button")
         
-        return {
+        result = {
             "success": True,
-            "message": response,
-            "show_chat": True  
+            **reply,
+            **step
         }
+        
+        self._end_turn(context, result)
+        return result
     
-    def _handle_payment_followup(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_payment_followup(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle any input after payment response - escalate with specific message"""
         
-        payment_option = context.payment_option
-        
-        if "refund status" in payment_option.lower():
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_refund_status"]
-        elif "payment failure" in payment_option.lower():
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_payment_failure"]
-        elif "invoice" in payment_option.lower():
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_invoice"]
-        elif "bill-related" in payment_option.lower():
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_bill_issues"]
-        elif "coupon did not work" in payment_option.lower():
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_coupon"]
-        else:
-            escalation_prompt = self.prompts.AI_PROMPTS["escalation_refund_status"]
-        
-        response = llm.generate_response(escalation_prompt)
-        
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now()
-        })
-        
         return {
             "success": True,
-            "message": response,
-            "show_chat": False,
-            "escalated": True
+            **await self._reply(context, self.flow.payment(context.payment_option).escalation_key),
+            **self.flow.step(context, "payment_escalated")
         }
     
-    def _handle_items_input(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_items_input(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle initial items input"""
         
         context.collected_items = user_input
-        context.stage = "photo_requested"
-        
-        ai_prompt = self.prompts.AI_PROMPTS["photo_request"].format(items=user_input)
-        response = llm.generate_response(ai_prompt)
-        
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now()
-        })
+        step = self.flow.step(context, "items_received")
         
         return {
             "success": True,
-            "message": response,
-            "show_input": False,
-            "show_chat": True
+            **await self._reply(context, "photo_request", items=user_input),
+            **step
         }
     
-    def _handle_photo_response(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_photo_response(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle photo response - Send separate thank you messages"""
         
-        context.stage = "additional_info"
+        step = self.flow.step(context, "photo_received")
         
         thank_you = "Thank you for providing the details."
         
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": thank_you,
-            "timestamp": datetime.now()
-        })
+        context.add_message("assistant", thank_you)
         
         return {
             "success": True,
             "message": thank_you,
-            "show_chat": True,
+            **step,
             "next_message": "Please provide additional information so that we can assist you better"
         }
     
-    def _handle_additional_info(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_additional_info(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle additional info based on category"""
         
-        category = context.selected_category
+        flow = self.flow.category(context.selected_category)
         items = context.collected_items 
+        context.stage = flow.next_stage
         
-        # Category 3
-        if category == "Few item(s) are missing in my order":
-            context.stage = "final_resolution"
-            
-            apology_prompt = self.prompts.AI_PROMPTS["apology_missing_first"].format(items=items)
-            apology = llm.generate_response(apology_prompt)
-            
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": apology,
-                "timestamp": datetime.now()
+        # Missing items: the apology and the reorder offer come from one round-trip
+        if flow.resolution == "reorder":
+            texts = await self._generate_batch(context, {
+                flow.apology_key: {"items": items},
+                flow.follow_up_key: {"items": items}
             })
             
             return {
                 "success": True,
-                "message": apology,
-                "show_chat": True,
-                "next_message_prompt": "reorder_offer_missing_second",
-                "next_message_items": items
+                **await self._reply(context, flow.apology_key, text=texts[flow.apology_key]),
+                **self.flow.step(context, "reorder_offered"),
+                **self._start_followup(context, texts[flow.follow_up_key])
             }
         
-        # Category 4
-        elif category == "Item(s) delivered are incorrect or wrong":
-            context.stage = "final_resolution"
-            
-            apology_prompt = self.prompts.AI_PROMPTS["apology_wrong"]
-            apology = llm.generate_response(apology_prompt)
-            
+        # Wrong items
+        elif flow.resolution == "refund_or_reorder":
             resolution_offer = "Would you prefer a refund or reorder for the affected items?"
             
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": apology,
-                "timestamp": datetime.now()
-            })
-            
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": resolution_offer,
-                "timestamp": datetime.now()
-            })
-            
             return {
                 "success": True,
-                "message": f"{apology}\n\n{resolution_offer}",
-                "show_chat": True
+                **await self._reply(context, flow.apology_key, suffix=f"\n\n{resolution_offer}", follow_up=[resolution_offer]),
+                **self.flow.step(context, "refund_or_reorder_offered")
             }
         
-        # Categories 2, 5, 6
-        context.stage = "resolution_choice"
-        
-        if "portion" in category.lower():
-            apology_prompt = self.prompts.AI_PROMPTS["apology_portion"]
-        elif "quality" in category.lower():
-            apology_prompt = self.prompts.AI_PROMPTS["apology_quality"]
-        elif "spillage" in category.lower():
-            apology_prompt = self.prompts.AI_PROMPTS["apology_spillage"]
-        else:
-            apology_prompt = self.prompts.AI_PROMPTS["apology_quality"]
-        
-        apology = llm.generate_response(apology_prompt)
-        
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": apology,
-            "timestamp": datetime.now()
-        })
-        
+        # Portion, quality and spillage issues
         return {
             "success": True,
-            "message": apology,
-            "show_chat": False,
+            **await self._reply(context, flow.apology_key),
+            **self.flow.step(context, "report_or_resolve_offered"),
             "multiple_messages": [
                 {"content": "We just checked with the restaurant regarding this matter.", "delay": 1000},
                 {"content": "However, we're here to help. If you need further assistance, do drop an email for us to escalate this issue further.\n\nPlease let us know how you would like to proceed", "delay": 2000}
             ],
-            "show_buttons": True,
             "buttons": [
                 "I only want to report this issue",
                 "I would still like a resolution for this issue"
             ]
         }
     
-    def _handle_resolution_choice(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_resolution_choice(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle resolution choice buttons"""
         
-        if "only want to report" in user_input.lower() or "report this issue" in user_input.lower():
-            report_prompt = self.prompts.AI_PROMPTS["report_thanks"]
-            response = llm.generate_response(report_prompt)
-            
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now()
-            })
-            
+        choice = self.intents.best(user_input, among=("report", "resolution"))
+        
+        if choice == "report":
             return {
                 "success": True,
-                "message": response,
-                "show_chat": False,
-                "resolved": True
+                **await self._reply(context, "report_thanks"),
+                **self.flow.step(context, "reported")
             }
         
-        elif "still like a resolution" in user_input.lower() or "resolution for this issue" in user_input.lower():
-            context.stage = "final_resolution"
+        elif choice == "resolution":
+            step = self.flow.step(context, "resolution_requested")
             
             items = context.collected_items
-            acknowledge_prompt = self.prompts.AI_PROMPTS["resolution_acknowledge"].format(items=items)
-            response = llm.generate_response(acknowledge_prompt)
-            
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now()
-            })
-            
             return {
                 "success": True,
-                "message": response,
-                "show_chat": True
+                **await self._reply(context, "resolution_acknowledge", items=items),
+                **step
             }
         
         else:
             return {
                 "success": True,
                 "message": "Please let me know if you want to report the issue or need a resolution.",
-                "show_chat": True
+                **self.flow.step(context, "resolution_unclear")
             }
     
-    def _handle_final_resolution(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_final_resolution(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle final refund/reorder choice"""
         
-        user_choice = user_input.lower()
         items = context.collected_items 
-        category = context.selected_category
+        flow = self.flow.category(context.selected_category)
         
-        # Category 3
-        if category == "Few item(s) are missing in my order":
-            if "reorder" in user_choice or "re-order" in user_choice or "order" in user_choice or "yes" in user_choice or "ok" in user_choice:
+        # Missing items can only be reordered
+        if flow.resolution == "reorder":
+            if self.intents.best(user_input, among=("reorder", "affirm", "decline")) in ("reorder", "affirm"):
                 response = self.prompts.generate_reorder_details(items)
                 
-                context.conversation_history.append({
-                    "role": "assistant",
-                    "content": response,
-                    "timestamp": datetime.now()
-                })
-                
-                closing_prompt = self.prompts.AI_PROMPTS["reorder_feedback_final"].format(items=items)
-                closing_msg = llm.generate_response(closing_prompt)
-                
-                context.conversation_history.append({
-                    "role": "assistant",
-                    "content": closing_msg,
-                    "timestamp": datetime.now()
-                })
+                context.add_message("assistant", response)
                 
                 return {
                     "success": True,
-                    "message": f"{response}\n\n{closing_msg}",
-                    "show_chat": False,
-                    "resolved": True  
+                    **await self._reply(context, "reorder_feedback_final", prefix=f"{response}\n\n", items=items),
+                    **self.flow.step(context, "reordered")
                 }
             else:
-                reorder_prompt = self.prompts.AI_PROMPTS["reorder_offer_missing_second"].format(items=items)
-                response = llm.generate_response(reorder_prompt)
-                
-                context.conversation_history.append({
-                    "role": "assistant",
-                    "content": response,
-                    "timestamp": datetime.now()
-                })
-                
                 return {
                     "success": True,
-                    "message": response,
-                    "show_chat": True
+                    **await self._reply(context, flow.follow_up_key, items=items),
+                    **self.flow.step(context, "reorder_declined")
                 }
         
-        # Categories 2, 4, 5, 6
+        # Refund or reorder for every other category
         else:
-            if "refund" in user_choice:
+            choice = self.intents.best(user_input, among=("refund", "reorder"))
+            
+            if choice == "refund":
                 response = self.prompts.generate_refund_details(items)
-                feedback_prompt = self.prompts.AI_PROMPTS["refund_feedback_final"].format(items=items)
-            elif "reorder" in user_choice or "re-order" in user_choice or "order" in user_choice:
+                feedback_key, step = "refund_feedback_final", "refunded"
+            elif choice == "reorder":
                 response = self.prompts.generate_reorder_details(items)
-                feedback_prompt = self.prompts.AI_PROMPTS["reorder_feedback_final"].format(items=items)
+                feedback_key, step = "reorder_feedback_final", "reordered"
             else:
                 response = f"Would you prefer a refund or reorder for {items}?"
                 
-                context.conversation_history.append({
-                    "role": "assistant",
-                    "content": response,
-                    "timestamp": datetime.now()
-                })
+                context.add_message("assistant", response)
                 
                 return {
                     "success": True,
                     "message": response,
-                    "show_chat": True
+                    **self.flow.step(context, "refund_or_reorder_unclear")
                 }
             
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now()
-            })
-            
-            closing_msg = llm.generate_response(feedback_prompt)
-            
-            context.conversation_history.append({
-                "role": "assistant",
-                "content": closing_msg,
-                "timestamp": datetime.now()
-            })
+            context.add_message("assistant", response)
             
             return {
                 "success": True,
-                "message": f"{response}\n\n{closing_msg}",
-                "show_chat": False,
-                "resolved": True
+                **await self._reply(context, feedback_key, prefix=f"{response}\n\n", items=items),
+                **self.flow.step(context, step)
             }
     
-    def _handle_general_chat(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
+    async def _handle_general_chat(self, context: ConversationContext, user_input: str) -> Dict[str, Any]:
         """Handle general chat - order-related only"""
         
-        relevance_prompt = f"""Is this query related to food delivery, order issues, refunds, delivery status, payment issues, or customer support for food delivery apps?
-        Query: "{user_input}"
-        
-        Answer only: YES or NO"""
+        is_relevant = self.relevance.classify(user_input)
+        query = {"query": user_input}
         
-        is_relevant = llm.generate_response(relevance_prompt)
+        # Ambiguous queries get the verdict and both candidate replies from one LLM round-trip
+        if is_relevant is None:
+            texts = await self._generate_batch(context, {
+                "relevance_check": query,
+                "order_query_response": query,
+                "redirect_non_order": query
+            })
+            prompt_key = "redirect_non_order" if "NO" in texts["relevance_check"].upper() else "order_query_response"
+            
+            return {
+                "success": True,
+                **await self._reply(context, prompt_key, text=texts[prompt_key]),
+                **self.flow.step(context, "general_answered")
+            }
         
-        if "NO" in is_relevant.upper():
-            redirect_prompt = self.prompts.AI_PROMPTS["redirect_non_order"].format(query=user_input)
-            response = llm.generate_response(redirect_prompt)
+        if is_relevant:
+            prompt_key = "order_query_response"
         else:
-            order_prompt = self.prompts.AI_PROMPTS["order_query_response"].format(query=user_input)
-            response = llm.generate_response(order_prompt)
-        
-        context.conversation_history.append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now()
-        })
+            prompt_key = "redirect_non_order"
         
         return {
             "success": True,
-            "message": response,
-            "show_chat": True
+            **await self._reply(context, prompt_key, **query),
+            **self.flow.step(context, "general_answered")
         }
 
-support_agent = CustomerSupportAgent()
+    def start_conversation(self, category: str) -> Dict[str, Any]:
+        """Start new conversation with category"""
+        return runtime.run_sync(self.astart_conversation(category))
+    
+    def process_input(self, session_id: str, user_input: str, stream: bool = False) -> Dict[str, Any]:
+        """Process user input based on conversation stage"""
+        return runtime.run_sync(self.aprocess_input(session_id, user_input, stream))
+    
+    def _handle_payment_button(self, session_id: str, button_text: str, stream: bool = False) -> Dict[str, Any]:
+        """Handle payment option button clicks"""
+        return runtime.run_sync(self._ahandle_payment_button(session_id, button_text, stream))
+    
+    def collect_followup(self, session_id: str) -> Dict[str, Any]:
+        """Return the pending follow-up message of a session and record it"""
+        return runtime.run_sync(self.acollect_followup(session_id))
+
+_support_agent: Optional[CustomerSupportAgent] = None
+_lock = threading.Lock()
+
+def get_support_agent() -> CustomerSupportAgent:
+    """Return the shared CustomerSupportAgent, building it and the LLM client on first use"""
+    global _support_agent
+    
+    if _support_agent is None:
+        with _lock:
+            if _support_agent is None:
+                # Loads .env before the agent reads its settings
+                get_llm()
+                _support_agent = CustomerSupportAgent()
+    
+    return _support_agent
+
+def warmup() -> float:
+    """Build the agent and LLM client and open the upstream connection; returns the warmup seconds"""
+    get_support_agent()
+    return get_llm().warmup()
+
+def __getattr__(name: str) -> Any:
+    # `from app.agents.cs_agents import support_agent` keeps working and builds the agent at that point
+    if name == "support_agent":
+        return get_support_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
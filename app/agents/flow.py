@@ -0,0 +1,153 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.intents import IntentMatcher
+
+# Stage entered after additional info for each resolution mode
+RESOLUTION_STAGES = {
+    "reorder": "final_resolution",
+    "refund_or_reorder": "final_resolution",
+    "report_or_resolve": "resolution_choice"
+}
+
+class CategoryFlow(NamedTuple):
+    category: str
+    resolution: str
+    apology_key: str
+    follow_up_key: Optional[str]
+    next_stage: str
+
+class PaymentFlow(NamedTuple):
+    option: str
+    prompt_key: str
+    escalation_key: str
+    match: str
+
+# Used for categories without a text flow, matching the old catch-all branch
+DEFAULT_CATEGORY_FLOW = CategoryFlow("", "report_or_resolve", "apology_quality", None, "resolution_choice")
+
+# Stage every new conversation starts in
+INITIAL_STAGE = "initial"
+
+# Result fields a turn step may set besides the stage it moves to
+STEP_FLAGS = frozenset(["show_input", "show_chat", "show_buttons", "resolved", "escalated"])
+
+class ConversationFlow:
+    """Flow tables from CustomerSupportPrompts, validated and compiled into O(1) lookups"""
+
+    def __init__(self, prompts: Any, agent: Any):
+        self.handlers: Dict[str, Callable] = {}
+        self.steps: Dict[str, Tuple[Optional[str], Dict[str, bool]]] = {}
+        self.categories: Dict[str, CategoryFlow] = {}
+        self.payments: Dict[str, PaymentFlow] = {}
+        self._default_payment: Optional[PaymentFlow] = None
+        self._payment_matcher: Optional[IntentMatcher] = None
+
+        self._compile_stages(prompts, agent)
+        self._compile_steps(prompts)
+        self._compile_categories(prompts)
+        self._compile_payments(prompts)
+
+    def handler(self, stage: str) -> Optional[Callable]:
+        return self.handlers.get(stage)
+
+    def step(self, context: Any, name: str) -> Dict[str, bool]:
+        """Move the context to the stage of a handler step and return the step's UI flags"""
+        stage, flags = self.steps[name]
+        if stage is not None:
+            context.stage = stage
+        return flags
+
+    def category(self, category: str) -> CategoryFlow:
+        return self.categories.get(category, DEFAULT_CATEGORY_FLOW)
+
+    def payment(self, option: str) -> PaymentFlow:
+        """Resolve a payment option from its button text, falling back to a scan for free text"""
+        flow = self.payments.get(option)
+        if flow is not None:
+            return flow
+
+        matched = self._payment_matcher.best(option)
+        return self.payments[matched] if matched is not None else self._default_payment
+
+    def prefetch_plan(self, context: Any) -> List[Tuple[str, Dict[str, str]]]:
+        """Prompts the next turn needs whatever the user types, for the stage the context is in"""
+        items = {"items": context.collected_items}
+
+        if context.stage == "additional_info":
+            flow = self.category(context.selected_category)
+            return [(flow.apology_key, items if flow.resolution == "reorder" else {})]
+
+        if context.stage == "resolution_choice":
+            return [("report_thanks", {}), ("resolution_acknowledge", items)]
+
+        if context.stage == "payment_response":
+            return [(self.payment(context.payment_option).escalation_key, {})]
+
+        return []
+
+    def _compile_stages(self, prompts: Any, agent: Any):
+        for stage, name in prompts.STAGE_HANDLERS.items():
+            handler = getattr(agent, name, None)
+            if not callable(handler):
+                raise ValueError(f"Stage '{stage}' refers to unknown handler '{name}'")
+            self.handlers[stage] = handler
+
+        if INITIAL_STAGE not in self.handlers:
+            raise ValueError(f"Stage '{INITIAL_STAGE}' has no handler")
+
+        for resolution, stage in RESOLUTION_STAGES.items():
+            if stage not in self.handlers:
+                raise ValueError(f"Resolution '{resolution}' leads to unknown stage '{stage}'")
+
+    def _compile_steps(self, prompts: Any):
+        for name, spec in prompts.TURN_STEPS.items():
+            flags = dict(spec)
+            stage = flags.pop("stage", None)
+            if stage is not None and stage not in self.handlers:
+                raise ValueError(f"Step '{name}' leads to unknown stage '{stage}'")
+
+            unknown = set(flags) - STEP_FLAGS
+            if unknown:
+                raise ValueError(f"Step '{name}' sets unknown result fields {sorted(unknown)}")
+
+            self.steps[name] = (stage, flags)
+
+    def _compile_categories(self, prompts: Any):
+        for category in prompts.CATEGORY_TEMPLATES:
+            if category not in prompts.UI_BEHAVIOR:
+                raise ValueError(f"Category '{category}' has no UI_BEHAVIOR entry")
+
+        for category, spec in prompts.CATEGORY_FLOWS.items():
+            if category not in prompts.CATEGORY_TEMPLATES:
+                raise ValueError(f"Flow defined for unknown category '{category}'")
+
+            resolution = spec["resolution"]
+            if resolution not in RESOLUTION_STAGES:
+                raise ValueError(f"Category '{category}' has unknown resolution '{resolution}'")
+
+            follow_up = spec.get("follow_up")
+            if resolution == "reorder" and follow_up is None:
+                raise ValueError(f"Category '{category}' is resolved by reorder but has no follow_up prompt")
+
+            for key in (spec["apology"], follow_up):
+                if key is not None and key not in prompts.AI_PROMPTS:
+                    raise ValueError(f"Category '{category}' refers to unknown prompt '{key}'")
+
+            self.categories[category] = CategoryFlow(
+                category, resolution, spec["apology"], follow_up, RESOLUTION_STAGES[resolution]
+            )
+
+    def _compile_payments(self, prompts: Any):
+        if set(prompts.PAYMENT_FLOWS) != set(prompts.PAYMENT_OPTIONS):
+            raise ValueError("PAYMENT_FLOWS must define exactly the PAYMENT_OPTIONS buttons")
+
+        for option in prompts.PAYMENT_OPTIONS:
+            spec = prompts.PAYMENT_FLOWS[option]
+            for key in (spec["prompt"], spec["escalation"]):
+                if key not in prompts.AI_PROMPTS:
+                    raise ValueError(f"Payment option '{option}' refers to unknown prompt '{key}'")
+
+            self.payments[option] = PaymentFlow(option, spec["prompt"], spec["escalation"], spec["match"].lower())
+
+        self._default_payment = self.payments[prompts.PAYMENT_OPTIONS[0]]
+        self._payment_matcher = IntentMatcher({option: [flow.match] for option, flow in self.payments.items()})
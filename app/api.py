@@ -0,0 +1,210 @@
+"""Headless JSON API for CustomerSupportAgent
+
+Run with:  uvicorn app.api:app
+
+Sessions live in the worker's memory by default, so run a single worker. Several workers
+(--workers N) need SESSION_BACKEND=sqlite on a shared database file and a load balancer that
+routes each session to the same worker, since an in-flight turn's state is only held by the
+worker that ran it.
+
+    GET  /health
+    GET  /metrics                                (Prometheus text; ?format=json for a JSON snapshot)
+    POST /conversations                          {"category": "..."}
+    POST /conversations/{session_id}/messages    {"text": "...", "stream": false}
+    POST /conversations/{session_id}/payment     {"option": "..."}
+    GET  /conversations/{session_id}/followup    (when a turn returned "next_message_pending")
+
+Turn endpoints reply with the agent's result dict. With "stream": true or an
+"Accept: text/event-stream" header they reply with server-sent events: one "token" event
+per chunk followed by a "result" event carrying the final result dict, or an "error" event
+if the turn fails once the stream has started.
+"""
+import json
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict
+
+from app import runtime
+from app.agents.cs_agents import get_support_agent
+from app.llm import get_llm
+from app.metrics import registry
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_TURN_ROUTE = re.compile(r"^/conversations/([0-9a-fA-F-]{36})/(messages|payment|followup)$")
+
+class HTTPError(Exception):
+    def __init__(self, status: int, error: str):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+async def _read_json(receive: Receive) -> Dict[str, Any]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+
+    if not isinstance(data, dict):
+        raise HTTPError(400, "JSON body must be an object")
+    return data
+
+def _require(data: Dict[str, Any], field: str) -> str:
+    value = data.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPError(400, f"'{field}' must be a non-empty string")
+    return value
+
+async def _send_json(send: Send, status: int, payload: Dict[str, Any]):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+def _sse(event: str, data: Any) -> Dict[str, Any]:
+    return {"type": "http.response.body", "body": f"event: {event}\ndata: {json.dumps(data)}\n\n".encode(), "more_body": True}
+
+async def _send_result(send: Send, result: Dict[str, Any], stream: bool):
+    """Send a turn result as JSON, or as server-sent events when the client asked for a stream"""
+    if not result.get("success"):
+        status = 410 if result.get("expired") else 404
+        await _send_json(send, status, result)
+        return
+
+    if not stream:
+        await _send_json(send, 200, result)
+        return
+
+    response_stream = result.pop("stream", None)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]
+    })
+
+    # The status line is out, so failures from here on are reported as an event
+    try:
+        if response_stream is None:
+            await send(_sse("token", result["message"]))
+        else:
+            async for token in runtime.aiterate(response_stream):
+                await send(_sse("token", token))
+            result["message"] = response_stream.text
+
+        await send(_sse("result", result))
+    except Exception as e:
+        print(f"API Error: {e}")
+        await send(_sse("error", {"success": False, "error": "Internal server error"}))
+
+    await send({"type": "http.response.body", "body": b""})
+
+def _wants_stream(scope: Scope, data: Dict[str, Any]) -> bool:
+    if data.get("stream"):
+        return True
+    accept = dict(scope.get("headers", [])).get(b"accept", b"")
+    return b"text/event-stream" in accept
+
+async def _handle(scope: Scope, receive: Receive, send: Send):
+    support_agent = get_support_agent()
+    method = scope["method"]
+    path = scope["path"].rstrip("/") or "/"
+
+    if path == "/health":
+        if method != "GET":
+            raise HTTPError(405, "Method not allowed")
+        await _send_json(send, 200, {"status": "ok", "sessions": len(support_agent.sessions)})
+        return
+
+    if path == "/metrics":
+        if method != "GET":
+            raise HTTPError(405, "Method not allowed")
+
+        if b"format=json" in scope.get("query_string", b""):
+            await _send_json(send, 200, registry.snapshot())
+            return
+
+        body = registry.prometheus().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    if path == "/conversations":
+        if method != "POST":
+            raise HTTPError(405, "Method not allowed")
+
+        category = _require(await _read_json(receive), "category")
+        if category not in support_agent.prompts.CATEGORY_TEMPLATES:
+            raise HTTPError(400, f"Unknown category: {category}")
+
+        await _send_json(send, 200, await runtime.run(support_agent.astart_conversation(category)))
+        return
+
+    match = _TURN_ROUTE.match(path)
+    if match is None:
+        raise HTTPError(404, "Not found")
+
+    session_id, action = match.groups()
+
+    if action == "followup":
+        if method != "GET":
+            raise HTTPError(405, "Method not allowed")
+        await _send_result(send, await runtime.run(support_agent.acollect_followup(session_id)), False)
+        return
+
+    if method != "POST":
+        raise HTTPError(405, "Method not allowed")
+
+    data = await _read_json(receive)
+    stream = _wants_stream(scope, data)
+
+    if action == "messages":
+        turn = support_agent.aprocess_input(session_id, _require(data, "text"), stream=stream)
+    else:
+        turn = support_agent._ahandle_payment_button(session_id, _require(data, "option"), stream=stream)
+
+    await _send_result(send, await runtime.run(turn), stream)
+
+async def app(scope: Scope, receive: Receive, send: Send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                runtime.get_loop()
+                # Build the agent before traffic arrives; LLM_WARMUP=1 also opens the upstream connection
+                get_support_agent()
+                if os.getenv("LLM_WARMUP", "0") == "1":
+                    await runtime.run(get_llm().awarmup())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await runtime.run(get_llm().aclose())
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    try:
+        await _handle(scope, receive, send)
+    except HTTPError as e:
+        await _send_json(send, e.status, {"success": False, "error": e.error})
+    except Exception as e:
+        print(f"API Error: {e}")
+        await _send_json(send, 500, {"success": False, "error": "Internal server error"})
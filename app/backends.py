@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from app.prompts.prompts import CustomerSupportPrompts
+from app.relevance import RelevanceClassifier
+
+class Completion(NamedTuple):
+    """Text produced by a backend with the provider's usage report (None when it has none)
+
+    Streams yield one Completion per chunk.
+    """
+    text: str
+    usage: Any = None
+
+class LLMBackend:
+    """Produces completions for GroqLLM, which adds scheduling, retries, pooling and fallbacks on top"""
+
+    name = ""
+    model = ""
+    # Exceptions worth another attempt: the same request may well succeed a moment later
+    retryable_errors: Tuple[type, ...] = ()
+
+    async def complete(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> Completion:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> AsyncIterator[Completion]:
+        raise NotImplementedError
+        yield
+
+    async def warmup(self):
+        """Open the upstream connection ahead of the first request (nothing to do by default)"""
+
+    async def aclose(self):
+        """Release upstream connections (nothing to do by default)"""
+
+class GroqBackend(LLMBackend):
+    """Chat completions from the Groq API"""
+
+    name = "groq"
+
+    def __init__(self, model: str = "llama-3.3-70b-versatile"):
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in environment variables")
+
+        # Imported here so the SDK (and httpx) only load when the Groq backend is used
+        from groq import APIConnectionError, APITimeoutError, AsyncGroq, InternalServerError, RateLimitError
+        from app.transport import create_timeout, get_http_client
+
+        self.retryable_errors = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+        # Retries are GroqLLM's, so the SDK's own retry loop is switched off. Connections come from
+        # the process-wide pool; GROQ_BASE_URL (read by the SDK) points the client elsewhere, e.g. a stub
+        self.client = AsyncGroq(api_key=api_key, max_retries=0, http_client=get_http_client(), timeout=create_timeout())
+        self.model = model
+
+    async def complete(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> Completion:
+        response = await self.client.chat.completions.create(model=self.model, messages=messages, **options)
+        return Completion(response.choices[0].message.content.strip(), getattr(response, "usage", None))
+
+    async def warmup(self):
+        # A cheap authenticated request: sets up DNS, TLS and a pooled connection, and checks the key
+        await self.client.models.list()
+
+    async def aclose(self):
+        from app import transport
+        await transport.aclose()
+
+    async def stream(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> AsyncIterator[Completion]:
+        stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **options)
+
+        async for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            # Groq reports usage on the last chunk of a stream
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if token or usage is not None:
+                yield Completion(token or "", usage)
+
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+_BATCH_TASK_RE = re.compile(r"^(\w+): (.*)$", re.MULTILINE)
+
+def _prompt_pattern(prompt: str) -> Pattern:
+    """Turn an AI_PROMPTS template into a regex capturing its placeholders from a formatted prompt"""
+    pattern, position = "", 0
+    for placeholder in _PLACEHOLDER_RE.finditer(prompt):
+        pattern += re.escape(prompt[position:placeholder.start()])
+        name = placeholder.group(1)
+        # A placeholder used twice must capture the same text
+        pattern += f"(?P={name})" if f"(?P<{name}>" in pattern else f"(?P<{name}>.*?)"
+        position = placeholder.end()
+
+    return re.compile(pattern + re.escape(prompt[position:]) + r"$", re.DOTALL)
+
+class TemplateBackend(LLMBackend):
+    """Deterministic, zero-latency replies rendered from TEMPLATE_RESPONSES
+
+    The prompt key and variables are recovered from the formatted prompt, so it can stand in
+    for the API anywhere, including JSON batches, and serves as the last-resort fallback.
+    """
+
+    name = "template"
+    model = "template"
+
+    def __init__(self, prompts: Any = CustomerSupportPrompts):
+        missing = set(prompts.AI_PROMPTS) - set(prompts.TEMPLATE_RESPONSES)
+        if missing:
+            raise ValueError(f"No template response for prompt keys: {', '.join(sorted(missing))}")
+
+        self.templates = prompts.TEMPLATE_RESPONSES
+        self.patterns = {key: _prompt_pattern(prompt) for key, prompt in prompts.AI_PROMPTS.items()}
+        self.relevance = RelevanceClassifier()
+        self.default = "I'm here to help you resolve this issue."
+
+    def _identify(self, prompt: str, prompt_key: Optional[str]) -> Tuple[Optional[str], Dict[str, str]]:
+        """Find the prompt key a formatted prompt came from and the variables it was filled with"""
+        keys = [prompt_key] if prompt_key in self.patterns else list(self.patterns)
+
+        for key in keys:
+            match = self.patterns[key].search(prompt)
+            if match is not None:
+                return key, match.groupdict()
+
+        return None, {}
+
+    def render(self, prompt: str, prompt_key: Optional[str] = None) -> str:
+        """Render the template reply for a formatted prompt"""
+        key, variables = self._identify(prompt, prompt_key)
+        if key is None:
+            return self.default
+
+        if key == "relevance_check":
+            variables["verdict"] = "YES" if self.relevance.score(variables.get("query", "")) >= 0.5 else "NO"
+
+        return self.templates[key].format(**variables)
+
+    def _reply(self, messages: List[Dict[str, str]], prompt_key: Optional[str], options: Dict[str, Any]) -> str:
+        prompt = messages[-1]["content"]
+
+        if options.get("response_format", {}).get("type") == "json_object":
+            tasks = prompt.split("\nTasks:\n", 1)[-1].split("\n\nRespond with only", 1)[0]
+            return json.dumps({key: self.render(task, key) for key, task in _BATCH_TASK_RE.findall(tasks)})
+
+        return self.render(prompt, prompt_key)
+
+    async def complete(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> Completion:
+        return Completion(self._reply(messages, prompt_key, options))
+
+    async def stream(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> AsyncIterator[Completion]:
+        words = self._reply(messages, prompt_key, options).split(" ")
+        for i, word in enumerate(words):
+            yield Completion(word if i == len(words) - 1 else word + " ")
+            await asyncio.sleep(0)
+
+BACKENDS = {"groq": GroqBackend, "template": TemplateBackend}
+
+def create_backend(name: str) -> LLMBackend:
+    """Build the backend registered under name ("groq" or "template")"""
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return backend()
@@ -0,0 +1,33 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Iterator, Optional
+
+# Monotonic time by which everything in the current turn must have finished
+_deadline: ContextVar[Optional[float]] = ContextVar("turn_deadline", default=None)
+
+@contextmanager
+def turn_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Give the LLM calls made inside the block seconds from now to finish; None lifts the bound"""
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[float]:
+    """Monotonic deadline of the current turn, for work consumed after the turn's handler returned"""
+    return _deadline.get()
+
+def seconds_until(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before a deadline from current_deadline(), or None when it is unbounded"""
+    return None if deadline is None else deadline - time.monotonic()
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current turn budget, or None when the turn is unbounded"""
+    return seconds_until(_deadline.get())
+
+async def within(seconds: Optional[float], coro: Awaitable[Any]) -> Any:
+    """Await coro under its own budget instead of the one inherited from the caller"""
+    with turn_budget(seconds):
+        return await coro
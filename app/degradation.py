@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.metrics import registry
+
+LEVELS = ("normal", "degraded", "severe")
+
+# Lowest level at which a tier stops calling upstream; critical prompts always do
+SHED_AT = {"optional": 1, "standard": 2}
+
+DEGRADATION_TRANSITIONS = registry.counter("llm_degradation_transitions_total", "Degradation level changes by new level", ("level",))
+DEGRADATION_REPLIES = registry.counter("llm_replies_served_total", "Replies served, by whether they were degraded", ("mode",))
+
+class DegradationController:
+    """Sheds non-critical LLM calls while upstream latency or errors break the SLO
+
+    Attempts are recorded over a rolling window. When the p95 latency or the error rate crosses
+    the SLO the controller moves to "degraded" (optional prompts are answered locally), and at
+    twice the SLO to "severe" (standard prompts too). It steps back down one level at a time,
+    once both signals have stayed below recover_ratio of the current level's thresholds for
+    recover_after seconds. A small share of shed calls still goes upstream as probes, so
+    recovery is noticed even when little traffic is left.
+    """
+
+    def __init__(self, tiers: Dict[str, str], slo_latency: float = 2.0, slo_error_rate: float = 0.1,
+                 window: float = 30.0, min_samples: int = 20, recover_after: float = 10.0,
+                 recover_ratio: float = 0.7, probe_rate: float = 0.05, interval: float = 1.0, enabled: bool = True):
+        self.tiers = tiers
+        self.slo_latency = slo_latency
+        self.slo_error_rate = slo_error_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.recover_after = recover_after
+        self.recover_ratio = recover_ratio
+        self.probe_rate = probe_rate
+        self.interval = interval
+        self.enabled = enabled
+
+        self.level = 0
+        self.p95 = 0.0
+        self.error_rate = 0.0
+        self._samples: deque = deque()
+        self._calm_since: Optional[float] = None
+        self._evaluated = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"served": 0, "degraded": 0, "transitions": 0}
+
+        registry.gauge("llm_degradation_level", "0 normal, 1 degraded, 2 severe", callback=lambda: self.level)
+        registry.gauge("llm_degraded_share", "Share of replies served degraded", callback=lambda: self.stats()["degraded_share"])
+
+    def record(self, latency: float, failed: bool = False):
+        """Record one upstream attempt"""
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency, failed))
+            if now - self._evaluated >= self.interval:
+                self._evaluate(now)
+
+    def should_degrade(self, prompt_key: Optional[str]) -> bool:
+        """Whether a reply for prompt_key should be served locally instead of from upstream"""
+        if not self.enabled:
+            return False
+
+        now = time.monotonic()
+        if now - self._evaluated >= self.interval:
+            with self._lock:
+                self._evaluate(now)
+
+        shed_at = SHED_AT.get(self.tiers.get(prompt_key, "critical"))
+        if shed_at is None or self.level < shed_at:
+            return False
+        return random.random() >= self.probe_rate
+
+    def served(self, degraded: bool):
+        """Count a reply for the degraded-response share"""
+        with self._lock:
+            self.counters["served"] += 1
+            if degraded:
+                self.counters["degraded"] += 1
+        DEGRADATION_REPLIES.inc("degraded" if degraded else "full")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            stats = {"state": LEVELS[self.level], "p95": self.p95, "error_rate": self.error_rate,
+                     "samples": len(self._samples)}
+
+        stats.update(counters)
+        stats["degraded_share"] = counters["degraded"] / counters["served"] if counters["served"] else 0.0
+        return stats
+
+    def _evaluate(self, now: float):
+        """Recompute the window's signals and move between levels (lock held)"""
+        self._evaluated = now
+        samples = self._samples
+        while samples and now - samples[0][0] > self.window:
+            samples.popleft()
+
+        if len(samples) < self.min_samples:
+            # Too little traffic to judge: count it as calm so a quiet period can recover
+            self.p95, self.error_rate = 0.0, 0.0
+        else:
+            latencies = sorted(sample[1] for sample in samples)
+            self.p95 = latencies[int(len(latencies) * 0.95)]
+            self.error_rate = sum(1 for sample in samples if sample[2]) / len(samples)
+
+        target = 0
+        for level in (2, 1):
+            if self.p95 > self.slo_latency * level or self.error_rate > self.slo_error_rate * level:
+                target = level
+                break
+
+        if target > self.level:
+            self._calm_since = None
+            self._transition(target)
+            return
+
+        calm = (self.p95 < self.slo_latency * self.level * self.recover_ratio and
+                self.error_rate < self.slo_error_rate * self.level * self.recover_ratio)
+        if self.level == 0 or not calm:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.recover_after:
+            self._calm_since = None
+            self._transition(self.level - 1)
+
+    def _transition(self, level: int):
+        print(f"LLM degradation: {LEVELS[self.level]} -> {LEVELS[level]} "
+              f"(p95 {self.p95:.2f}s, error rate {self.error_rate:.0%})")
+        self.level = level
+        self.counters["transitions"] += 1
+        DEGRADATION_TRANSITIONS.inc(LEVELS[level])
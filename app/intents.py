@@ -0,0 +1,78 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# A negator up to two words before a keyword cancels it ("don't want a refund"); a bare "no"
+# only cancels the keyword right after it ("no refund, reorder please" but "no, just a refund")
+_NEGATION_RE = re.compile(r"(?:(?:\bnot|\bdon'?t|\bdo not|\bnever|\bwithout|\binstead of|\bno need (?:to|for))\s+(?:[\w'-]+\s+){0,2}"
+                          r"|\bno\s+)$")
+_NEGATOR_HINT = re.compile(r"\b(?:not|don'?t|never|without|instead|need|no)\b")
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Compile phrases into a prefix-trie regex so shared prefixes are only tried once"""
+    trie: Dict[str, dict] = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A phrase ends here too: the greedy optional group still prefers the longer phrase
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+class IntentMatcher:
+    """Matches every intent's keyword phrases in one regex pass and ranks the intents found
+
+    Phrases match on word boundaries, so "order" does not fire inside "reorder" or "border".
+    Each hit scores the number of words in the phrase times the intent's weight (default 1);
+    negated hits are ignored.
+    """
+
+    def __init__(self, intents: Dict[str, Iterable[str]], weights: Optional[Dict[str, float]] = None):
+        weights = weights or {}
+        self._phrases: Dict[str, Tuple[str, float]] = {}
+
+        for intent, phrases in intents.items():
+            for phrase in phrases:
+                phrase = phrase.lower()
+                if phrase in self._phrases:
+                    raise ValueError(f"Phrase '{phrase}' is mapped to both '{self._phrases[phrase][0]}' and '{intent}'")
+                self._phrases[phrase] = (intent, len(phrase.split()) * weights.get(intent, 1.0))
+
+        self._pattern = re.compile(rf"(?<![\w-])(?:{_trie_pattern(self._phrases)})(?![\w-])")
+
+    def match(self, text: str) -> List[Tuple[str, float]]:
+        """Return (intent, score) pairs, best first; ties go to the intent mentioned first"""
+        lowered = text.lower()
+        scores: Dict[str, float] = {}
+        first_seen: Dict[str, int] = {}
+
+        negatable = _NEGATOR_HINT.search(lowered) is not None
+
+        for hit in self._pattern.finditer(lowered):
+            start = hit.start()
+            if negatable and _NEGATION_RE.search(lowered, max(0, start - 40), start):
+                continue
+
+            intent, weight = self._phrases[hit.group()]
+            scores[intent] = scores.get(intent, 0) + weight
+            first_seen.setdefault(intent, start)
+
+        return sorted(scores.items(), key=lambda item: (-item[1], first_seen[item[0]]))
+
+    def best(self, text: str, among: Optional[Iterable[str]] = None) -> Optional[str]:
+        """Return the top-ranked intent, optionally restricted to a set of intents"""
+        allowed = set(among) if among is not None else None
+
+        for intent, _ in self.match(text):
+            if allowed is None or intent in allowed:
+                return intent
+
+        return None
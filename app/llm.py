@@ -1,44 +1,561 @@
+import asyncio
+import json
 import os
-from groq import Groq
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Iterator, List, Optional
 from dotenv import load_dotenv
 
-load_dotenv()
+from app import runtime
+from app.backends import TemplateBackend, create_backend
+from app.budgets import current_deadline, remaining, seconds_until, within
+from app.degradation import DegradationController
+from app.metrics import LLM_FALLBACKS, LLM_LATENCY, LLM_OUTCOMES, LLM_TOKENS, registry
+from app.prompts.prompts import CustomerSupportPrompts
+from app.response_pool import ResponsePool
+from app.scheduler import PRIORITY_BACKGROUND, PRIORITY_NORMAL, RequestScheduler
+from app.single_flight import SingleFlight
+
+OUTCOMES = ("ok", "timeout", "retryable_error", "error", "retried", "budget_exhausted", "hedged", "hedge_won",
+            "fallback", "batched", "batch_item_fallback")
 
 class GroqLLM:
     def __init__(self):
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        self.client = Groq(api_key=api_key)
-        self.model = "llama-3.3-70b-versatile"
-    
-    def generate_response(self, prompt: str, context: str = "") -> str:
-        """Generate natural 1-2 line responses"""
-        try:
-            system_prompt = """You are a helpful customer support bot for food delivery. Keep responses:
+        # "groq" (the default) or "template" for instant offline replies
+        self.backend = create_backend(os.getenv("LLM_BACKEND", "groq"))
+        self.templates = TemplateBackend()
+        # Failed calls are answered from the templates unless LLM_FALLBACK=static
+        self.template_fallback = os.getenv("LLM_FALLBACK", "template") == "template"
+        self.system_prompt = """You are a helpful customer support bot for food delivery. Keep responses:
             - 1-2 lines maximum
             - Natural and conversational like real customer support
             - Empathetic and solution-focused
             - Professional but friendly
             - Realistic like actual food delivery support agents"""
-            
-            full_prompt = f"{context}\n\n{prompt}" if context else prompt
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": full_prompt}
-                ],
-                max_tokens=100,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+        self.fallback_response = "I'm here to help you resolve this issue."
+        self.max_tokens = 100
+        self.pooled_keys = CustomerSupportPrompts.STATIC_PROMPT_KEYS
+        self.priorities = CustomerSupportPrompts.PROMPT_PRIORITY
+        # Admission control for the account's rate limits; 0 leaves a per-minute budget unlimited
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+        self.scheduler = RequestScheduler(
+            rpm=float(os.getenv("LLM_RPM", "0")),
+            tpm=float(os.getenv("LLM_TPM", "0")),
+            initial_limit=min(16, max_concurrency),
+            max_limit=max_concurrency,
+            target_latency=float(os.getenv("LLM_TARGET_LATENCY", "2.0"))
+        )
+        registry.gauge("llm_queue_depth", "LLM calls waiting for admission", callback=lambda: self.scheduler.stats()["queue_depth"])
+        registry.gauge("llm_in_flight", "LLM calls admitted and not yet finished", callback=lambda: self.scheduler.in_flight)
+        registry.gauge("llm_concurrency_limit", "Current AIMD concurrency limit", callback=lambda: self.scheduler.limit)
+        self.attempt_timeout = float(os.getenv("LLM_TIMEOUT", "5.0"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "0.2"))
+        self.backoff_cap = float(os.getenv("LLM_BACKOFF_CAP", "2.0"))
+        # Send a duplicate request once an attempt outlives the observed p95 latency
+        self.hedge = os.getenv("LLM_HEDGE", "0") == "1"
+        self.latencies: deque = deque(maxlen=256)
+        # Refills are background work and must not inherit the budget of the turn that triggered them
+        self.response_pool = ResponsePool(
+            lambda key, prompt: within(None, self._complete(prompt, priority=PRIORITY_BACKGROUND, prompt_key=key)),
+            variants=int(os.getenv("RESPONSE_POOL_VARIANTS", "5")),
+            ttl=float(os.getenv("RESPONSE_POOL_TTL", "1800"))
+        )
+        # Prompt keys whose identical in-flight requests share one upstream call:
+        # "*" for all (the default), a comma-separated list of keys, or empty to disable
+        single_flight = os.getenv("SINGLE_FLIGHT_KEYS", "*").strip()
+        self.single_flight_keys: Optional[FrozenSet[str]] = (
+            None if single_flight == "*" else frozenset(k.strip() for k in single_flight.split(",") if k.strip())
+        )
+        self.single_flight = SingleFlight()
+        # Answer non-critical prompts locally while upstream breaks its SLO (DEGRADATION=0 disables)
+        self.degradation = DegradationController(
+            CustomerSupportPrompts.PROMPT_CRITICALITY,
+            slo_latency=float(os.getenv("SLO_LATENCY", "2.0")),
+            slo_error_rate=float(os.getenv("SLO_ERROR_RATE", "0.1")),
+            recover_after=float(os.getenv("DEGRADATION_RECOVER_AFTER", "10")),
+            enabled=os.getenv("DEGRADATION", "1") == "1"
+        )
+
+    @property
+    def retryable_errors(self) -> tuple:
+        return self.backend.retryable_errors + (asyncio.TimeoutError,)
+
+    def _build_messages(self, prompt: str, context: str = "") -> List[Dict[str, str]]:
+        """Build chat messages for a prompt"""
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": full_prompt}
+        ]
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+        """Rough token count of a request (about 4 characters per token) plus its completion budget"""
+        return sum(len(m["content"]) for m in messages) // 4 + (max_tokens or self.max_tokens)
+
+    def _priority(self, prompt_key: Optional[str], priority: Optional[int] = None) -> int:
+        if priority is not None:
+            return priority
+        return self.priorities.get(prompt_key, PRIORITY_NORMAL)
+
+    @staticmethod
+    def _outcome(error: BaseException) -> str:
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            return "cancelled"
+        if isinstance(error, asyncio.TimeoutError):
+            return "timeout"
+        return "rate_limited" if getattr(error, "status_code", None) == 429 else "error"
+
+    def _count(self, outcome: str):
+        LLM_OUTCOMES.inc(outcome)
+
+    def _fallback(self, prompt: str, prompt_key: Optional[str]) -> str:
+        self._count("fallback")
+        LLM_FALLBACKS.inc(prompt_key or "none")
+
+        if self.template_fallback:
+            return self.templates.render(prompt, prompt_key)
+        return self.fallback_response
+
+    def _degraded(self, prompt: str, prompt_key: Optional[str]) -> str:
+        """Answer a prompt from the templates because upstream is breaking its SLO"""
+        self.degradation.served(degraded=True)
+        return self.templates.render(prompt, prompt_key)
+
+    @staticmethod
+    def _record_usage(label: str, usage: Any):
+        if usage is not None:
+            LLM_TOKENS.inc(label, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+            LLM_TOKENS.inc(label, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+    def _attempt_budget(self, left: Optional[float]) -> float:
+        """Timeout for the next attempt: the per-attempt limit, cut short by the seconds left in the turn"""
+        return self.attempt_timeout if left is None else min(self.attempt_timeout, left)
+
+    def _backoff(self, attempt: int, left: Optional[float]) -> Optional[float]:
+        """Full-jitter delay before retry number attempt + 1, or None when it would overrun the budget"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return None if left is not None and delay >= left else delay
+
+    def _hedge_delay(self) -> Optional[float]:
+        """p95 of recent attempt latencies, or None when hedging is off, unwarmed or the scheduler is full"""
+        if not self.hedge or len(self.latencies) < 20 or self.scheduler.in_flight >= int(self.scheduler.limit):
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * 0.95)]
+
+    async def _attempt(self, messages: List[Dict[str, str]], priority: int, label: str, options: Dict[str, Any],
+                       cut: List[float]) -> str:
+        """Make one upstream completion call once the scheduler admits it, raising on failure
+
+        A call cancelled while the backend was working on it appends its latency so far to cut.
+        """
+        options = {"max_tokens": self.max_tokens, "temperature": 0.7, **options}
+        estimate = self._estimate_tokens(messages, options["max_tokens"])
+
+        await self.scheduler.acquire(priority, estimate)
+        started = time.monotonic()
+
+        try:
+            completion = await self.backend.complete(messages, label, **options)
+        except BaseException as e:
+            outcome = self._outcome(e)
+            self.scheduler.release(outcome, time.monotonic() - started, estimate)
+            if outcome != "cancelled":
+                self.degradation.record(time.monotonic() - started, failed=True)
+            else:
+                cut.append(time.monotonic() - started)
+            raise
+
+        latency = time.monotonic() - started
+        self.latencies.append(latency)
+        self.degradation.record(latency)
+        LLM_LATENCY.observe(latency, label)
+        self._record_usage(label, completion.usage)
+        self.scheduler.release("ok", latency, estimate, getattr(completion.usage, "total_tokens", None))
+
+        return completion.text
+
+    async def _hedged(self, messages: List[Dict[str, str]], priority: int, label: str, options: Dict[str, Any],
+                      cut: List[float]) -> str:
+        """Run an attempt, racing a duplicate against it once it is slower than the p95"""
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._attempt(messages, priority, label, options, cut)
+
+        tasks = {asyncio.ensure_future(self._attempt(messages, priority, label, options, cut))}
+        primary = next(iter(tasks))
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._count("hedged")
+                tasks.add(asyncio.ensure_future(self._attempt(messages, priority, label, options, cut)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_won")
+                        return task.result()
+
+            return primary.result()
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _complete(self, prompt: str, context: str = "", priority: int = PRIORITY_NORMAL,
+                        prompt_key: Optional[str] = None, **options) -> str:
+        """Complete a prompt within the turn budget, retrying retryable errors with jittered backoff"""
+        messages = self._build_messages(prompt, context)
+        label = prompt_key or "none"
+
+        for attempt in range(self.max_retries + 1):
+            timeout = self._attempt_budget(remaining())
+            if timeout <= 0:
+                self._count("budget_exhausted")
+                raise asyncio.TimeoutError("Turn budget exhausted")
+
+            cut: List[float] = []
+            try:
+                response = await asyncio.wait_for(self._hedged(messages, priority, label, options, cut), timeout)
+
+            except self.retryable_errors as e:
+                self._count("timeout" if isinstance(e, asyncio.TimeoutError) else "retryable_error")
+                if isinstance(e, asyncio.TimeoutError) and cut:
+                    # The upstream call itself only saw a cancellation; one still queued in the
+                    # scheduler says nothing about upstream latency
+                    self.degradation.record(max(cut), failed=True)
+                delay = self._backoff(attempt, remaining()) if attempt < self.max_retries else None
+                if delay is None:
+                    raise
+                self._count("retried")
+                await asyncio.sleep(delay)
+
+            except Exception:
+                self._count("error")
+                raise
+
+            else:
+                self._count("ok")
+                return response
+
+    async def _complete_shared(self, prompt: str, context: str = "", prompt_key: Optional[str] = None,
+                               priority: Optional[int] = None) -> str:
+        """Complete a prompt, sharing the upstream call with identical requests already in flight"""
+        priority = self._priority(prompt_key, priority)
+
+        if self.single_flight_keys is not None and prompt_key not in self.single_flight_keys:
+            return await self._complete(prompt, context, priority, prompt_key)
+
+        key = (self.backend.model, self.system_prompt, context, prompt, self.max_tokens, 0.7)
+        shared = self.single_flight.do(key, lambda: self._complete(prompt, context, priority, prompt_key))
+        # The call may have been started by a prefetch without a budget, so wait only for ours
+        return await asyncio.wait_for(shared, remaining())
+
+    async def agenerate_response(self, prompt: str, context: str = "", prompt_key: Optional[str] = None,
+                                 priority: Optional[int] = None) -> str:
+        """Generate natural 1-2 line responses without blocking the event loop"""
+        pooled = prompt_key in self.pooled_keys and not context
+
+        if pooled:
+            cached = self.response_pool.get(prompt_key, prompt)
+            if cached is not None:
+                self.degradation.served(degraded=False)
+                return cached
+
+        if self.degradation.should_degrade(prompt_key):
+            return self._degraded(prompt, prompt_key)
+
+        return await self._agenerate_uncached(prompt, context, prompt_key, priority)
+
+    async def _agenerate_uncached(self, prompt: str, context: str = "", prompt_key: Optional[str] = None,
+                                  priority: Optional[int] = None) -> str:
+        """Generate a response upstream, answering with the fallback line on failure"""
+        self.degradation.served(degraded=False)
+
+        try:
+            response = await self._complete_shared(prompt, context, prompt_key, priority)
+
         except Exception as e:
-            print(f"Groq Error: {e}")
-            return "I'm here to help you resolve this issue."
+            print(f"Groq Error: {e!r}")
+            return self._fallback(prompt, prompt_key)
+
+        if prompt_key in self.pooled_keys and not context:
+            self.response_pool.add(prompt_key, prompt, response)
+
+        return response
+
+    def generate_response(self, prompt: str, context: str = "", prompt_key: Optional[str] = None) -> str:
+        """Generate natural 1-2 line responses"""
+        return runtime.run_sync(self.agenerate_response(prompt, context, prompt_key))
+
+    def _batch_prompt(self, prompts: Dict[str, str]) -> str:
+        """Combine several prompts into one request for a JSON object with a reply per prompt key"""
+        tasks = "\n".join(f"{key}: {prompt}" for key, prompt in prompts.items())
+        shape = ",\n".join(f'  "{key}": <reply for {key}>' for key in prompts)
+
+        return f"""Write a separate reply for each task below, following its instructions.
+
+Tasks:
+{tasks}
+
+Respond with only a JSON object of this shape, each reply a plain string:
+{{
+{shape}
+}}"""
+
+    async def agenerate_batch(self, prompts: Dict[str, str], priority: Optional[int] = None) -> Dict[str, str]:
+        """Generate replies for several prompt keys from one JSON completion, falling back per item
+
+        Pooled keys are served from the response pool and shed keys from the templates. A reply
+        that is missing or not a non-empty string in the completion is generated on its own.
+        """
+        results: Dict[str, str] = {}
+
+        for key, prompt in prompts.items():
+            if key in self.pooled_keys:
+                cached = self.response_pool.get(key, prompt)
+                if cached is not None:
+                    results[key] = cached
+                    self.degradation.served(degraded=False)
+                    continue
+
+            if self.degradation.should_degrade(key):
+                results[key] = self._degraded(prompt, key)
+
+        pending = {key: prompt for key, prompt in prompts.items() if key not in results}
+        invalid = list(pending)
+
+        if len(pending) > 1:
+            replies: Any = {}
+            try:
+                raw = await self._complete(
+                    self._batch_prompt(pending),
+                    priority=min(self._priority(key, priority) for key in pending),
+                    prompt_key="batch",
+                    max_tokens=self.max_tokens * len(pending),
+                    response_format={"type": "json_object"}
+                )
+                replies = json.loads(raw)
+            except Exception as e:
+                print(f"Groq Error: {e!r}")
+
+            invalid = []
+            for key, prompt in pending.items():
+                reply = replies.get(key) if isinstance(replies, dict) else None
+                if isinstance(reply, str) and reply.strip():
+                    results[key] = reply.strip()
+                    self._count("batched")
+                    self.degradation.served(degraded=False)
+                    if key in self.pooled_keys:
+                        self.response_pool.add(key, prompt, results[key])
+                else:
+                    invalid.append(key)
+                    self._count("batch_item_fallback")
+
+        if invalid:
+            replies = await asyncio.gather(*(self._agenerate_uncached(pending[key], prompt_key=key, priority=priority)
+                                             for key in invalid))
+            results.update(zip(invalid, replies))
+
+        return {key: results[key] for key in prompts}
+
+    def generate_batch(self, prompts: Dict[str, str]) -> Dict[str, str]:
+        """Generate replies for several prompt keys from one JSON completion"""
+        return runtime.run_sync(self.agenerate_batch(prompts))
+
+    async def astream_response(self, prompt: str, context: str = "", prompt_key: Optional[str] = None,
+                               deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield response tokens as they arrive from the backend
+
+        deadline bounds the whole stream; it defaults to the current turn's, and a stream consumed
+        after its turn's handler returned passes the one captured when the turn created it.
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        pooled = prompt_key in self.pooled_keys and not context
+
+        if pooled:
+            cached = self.response_pool.get(prompt_key, prompt)
+            if cached is not None:
+                self.degradation.served(degraded=False)
+                yield cached
+                return
+
+        if self.degradation.should_degrade(prompt_key):
+            yield self._degraded(prompt, prompt_key)
+            return
+
+        self.degradation.served(degraded=False)
+        parts = []
+
+        try:
+            async for token in self._astream_attempts(self._build_messages(prompt, context), self._priority(prompt_key),
+                                                      prompt_key or "none", deadline):
+                if not parts:
+                    token = token.lstrip()
+                parts.append(token)
+                yield token
+
+        except Exception as e:
+            print(f"Groq Error: {e!r}")
+            if not parts:
+                yield self._fallback(prompt, prompt_key)
+            return
+
+        if pooled and parts:
+            self.response_pool.add(prompt_key, prompt, "".join(parts).strip())
+
+    async def _astream_attempts(self, messages: List[Dict[str, str]], priority: int, label: str,
+                                deadline: Optional[float]) -> AsyncIterator[str]:
+        """Yield the tokens of one streamed completion, retrying until the first token has arrived
+
+        Every wait, for the stream to open and for each chunk, is bounded by the attempt timeout
+        and by the time left before deadline.
+        """
+        estimate = self._estimate_tokens(messages)
+
+        for attempt in range(self.max_retries + 1):
+            timeout = self._attempt_budget(seconds_until(deadline))
+            if timeout <= 0:
+                self._count("budget_exhausted")
+                raise asyncio.TimeoutError("Turn budget exhausted")
+
+            streamed = False
+            outcome = "ok"
+            await self.scheduler.acquire(priority, estimate)
+            started = time.monotonic()
+
+            try:
+                chunks = self.backend.stream(messages, label, max_tokens=self.max_tokens, temperature=0.7)
+                while True:
+                    try:
+                        # The first wait includes opening the stream, so it gets the whole attempt budget
+                        wait = self._attempt_budget(seconds_until(deadline)) if streamed else timeout
+                        chunk = await asyncio.wait_for(chunks.__anext__(), wait)
+                    except StopAsyncIteration:
+                        break
+
+                    self._record_usage(label, chunk.usage)
+                    if chunk.text:
+                        streamed = True
+                        yield chunk.text
+
+            except self.retryable_errors as e:
+                outcome = self._outcome(e)
+                self._count("timeout" if isinstance(e, asyncio.TimeoutError) else "retryable_error")
+                self.degradation.record(time.monotonic() - started, failed=True)
+                # Tokens already shown cannot be taken back, so only a stream that never started is retried
+                delay = self._backoff(attempt, seconds_until(deadline)) if attempt < self.max_retries and not streamed else None
+                if delay is None:
+                    raise
+                self._count("retried")
+
+            except BaseException as e:
+                outcome = self._outcome(e)
+                if not isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                    self._count("error")
+                raise
+
+            else:
+                self._count("ok")
+                LLM_LATENCY.observe(time.monotonic() - started, label)
+                self.degradation.record(time.monotonic() - started)
+                return
+
+            finally:
+                self.scheduler.release(outcome, time.monotonic() - started, estimate)
+
+            await asyncio.sleep(delay)
+
+    async def awarmup(self) -> float:
+        """Open the upstream connection before traffic arrives and return the seconds it took"""
+        started = time.monotonic()
+        try:
+            await self.backend.warmup()
+        except Exception as e:
+            print(f"Groq Error: {e!r}")
+        return time.monotonic() - started
+
+    def warmup(self) -> float:
+        """Open the upstream connection before traffic arrives"""
+        return runtime.run_sync(self.awarmup())
+
+    async def aclose(self):
+        """Close upstream connections on shutdown"""
+        await self.backend.aclose()
+
+    def stats(self) -> Dict[str, float]:
+        """Outcome counters for upstream calls, with the p95 attempt latency"""
+        stats = {outcome: LLM_OUTCOMES.get(outcome) for outcome in OUTCOMES}
+
+        latencies = sorted(self.latencies)
+        stats["latency_p95"] = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+        return stats
+
+    def stream_response(self, prompt: str, context: str = "", prompt_key: Optional[str] = None) -> Iterator[str]:
+        """Yield response tokens as they arrive from the backend"""
+        return runtime.iterate_sync(self.astream_response(prompt, context, prompt_key))
+
+class ResponseStream:
+    """Streamed assistant message that keeps the full text once it has been consumed"""
+
+    def __init__(self, prompt: str, prompt_key: Optional[str] = None, prefix: str = "", suffix: str = "",
+                 on_complete: Optional[Callable[[str], None]] = None):
+        self.prompt = prompt
+        self.prompt_key = prompt_key
+        self.prefix = prefix
+        self.suffix = suffix
+        self.on_complete = on_complete
+        # Consumed after the handler that built it returned, so the turn's deadline is kept here
+        self.deadline = current_deadline()
+        self.text: Optional[str] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self.prefix:
+            yield self.prefix
+
+        parts = []
+        async for token in get_llm().astream_response(self.prompt, prompt_key=self.prompt_key, deadline=self.deadline):
+            parts.append(token)
+            yield token
+
+        if self.suffix:
+            yield self.suffix
+
+        generated = "".join(parts).strip()
+        self.text = f"{self.prefix}{generated}{self.suffix}"
+
+        if self.on_complete is not None:
+            self.on_complete(generated)
+
+    def __iter__(self) -> Iterator[str]:
+        return runtime.iterate_sync(self)
+
+_llm: Optional[GroqLLM] = None
+_lock = threading.Lock()
+
+def get_llm() -> GroqLLM:
+    """Return the shared GroqLLM, reading .env and building the client on first use"""
+    global _llm
+
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                load_dotenv()
+                _llm = GroqLLM()
+
+    return _llm
 
-llm = GroqLLM()
+def __getattr__(name: str) -> Any:
+    # `from app.llm import llm` keeps working and builds the client at that point
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,222 @@
+import bisect
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from a pool hit to a request that ran into its timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels)
+
+    def prometheus(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Monotonic count per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(labels), 0)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def prometheus(self) -> List[str]:
+        lines = super().prometheus()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+    def snapshot(self) -> Any:
+        return {"/".join(key) or "total": value for key, value in sorted(self.values().items())}
+
+class Gauge(_Metric):
+    """Current value per label combination, or one value read from a callback at collection time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        if self.callback is not None:
+            try:
+                return {(): float(self.callback())}
+            except Exception as e:
+                print(f"Metrics Error: {self.name}: {e}")
+                return {}
+
+        with self._lock:
+            return dict(self._values)
+
+    def prometheus(self) -> List[str]:
+        lines = super().prometheus()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+    def snapshot(self) -> Any:
+        return {"/".join(key) or "value": value for key, value in sorted(self.values().items())}
+
+class Histogram(_Metric):
+    """Fixed-bucket distribution per label combination; observe() is a bisect and three additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label key: [count per bucket (last is +Inf)..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def series(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        with self._lock:
+            series = list(self._series.get(tuple(labels), ()))
+        if not series or not series[-1]:
+            return 0.0
+
+        rank = q * series[-1]
+        seen = 0
+        # Values past the last bound report that bound, which keeps snapshots valid JSON
+        for bound, count in zip(self.buckets + (self.buckets[-1],), series):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def prometheus(self) -> List[str]:
+        lines = super().prometheus()
+        for key, series in sorted(self.series().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket = 'le="' + le + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, bucket)} {cumulative:g}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]:g}")
+        return lines
+
+    def snapshot(self) -> Any:
+        snapshot = {}
+        for key, series in sorted(self.series().items()):
+            count = series[-1]
+            snapshot["/".join(key) or "all"] = {
+                "count": count,
+                "sum": series[-2],
+                "mean": series[-2] / count if count else 0.0,
+                "p50": self.quantile(0.5, *key),
+                "p95": self.quantile(0.95, *key),
+                "p99": self.quantile(0.99, *key)
+            }
+        return snapshot
+
+class MetricsRegistry:
+    """Named metrics with Prometheus text exposition and a JSON-friendly snapshot"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric '{metric.name}' is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self._register(Gauge(name, help, labels, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every metric as plain dicts and numbers"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+registry = MetricsRegistry()
+
+LLM_LATENCY = registry.histogram("llm_request_seconds", "Upstream LLM attempt latency by prompt key", ("prompt_key",))
+LLM_TOKENS = registry.counter("llm_tokens_total", "Tokens reported in response.usage by prompt key", ("prompt_key", "kind"))
+LLM_OUTCOMES = registry.counter("llm_outcomes_total", "Upstream LLM call outcomes", ("outcome",))
+LLM_FALLBACKS = registry.counter("llm_fallback_responses_total", "Replies answered with the fallback line by prompt key", ("prompt_key",))
+STAGE_LATENCY = registry.histogram("stage_handler_seconds", "Time spent in a conversation stage handler", ("stage",))
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app import runtime
+from app.budgets import remaining
+from app.metrics import registry
+
+PrefetchPlan = List[Tuple[str, Dict[str, str]]]
+
+PREFETCH_EVENTS = registry.counter("prefetch_replies_total", "Prefetched replies by what happened to them", ("event",))
+
+def _plan_key(prompt_key: str, variables: Dict[str, str]) -> tuple:
+    return (prompt_key, *sorted(variables.items()))
+
+class Prefetcher:
+    """Speculatively generates replies the next turn will need and keeps them on the context
+
+    Entries live in context.prefetched keyed by (prompt_key, variables). A reply that is taken
+    while still in flight counts as "late", and one that does not arrive within the turn budget
+    as "timed_out"; entries left over when the stage changes are cancelled and counted as "discarded".
+    """
+
+    def __init__(self, generate: Callable[..., Awaitable[str]]):
+        self.generate = generate
+        self._lock = threading.Lock()
+        self.counters = {"started": 0, "hits": 0, "late": 0, "timed_out": 0, "discarded": 0}
+        registry.gauge("prefetch_hit_rate", "Share of started prefetches that were used", callback=lambda: self.stats()["hit_rate"])
+
+    def replan(self, context: Any, plan: PrefetchPlan):
+        """Keep prefetches still in the plan, cancel the rest and start the missing ones"""
+        wanted = {_plan_key(key, variables): (key, variables) for key, variables in plan}
+        current = context.prefetched or {}
+        started = discarded = 0
+
+        for plan_key in list(current):
+            if plan_key not in wanted:
+                current.pop(plan_key).cancel()
+                discarded += 1
+
+        for plan_key, (key, variables) in wanted.items():
+            if plan_key not in current:
+                current[plan_key] = runtime.submit(self.generate(key, **variables))
+                started += 1
+
+        context.prefetched = current or None
+        self._count(started=started, discarded=discarded)
+
+    async def take(self, context: Any, prompt_key: str, variables: Dict[str, str]) -> Optional[str]:
+        """Return the prefetched reply for this prompt, waiting for it if still in flight
+
+        The wait is bounded by what is left of the turn budget, since the prefetch itself runs
+        without one. A reply that misses it is cancelled and None is returned, so the caller
+        generates the reply under the budget instead.
+        """
+        if not context.prefetched:
+            return None
+
+        plan_key = _plan_key(prompt_key, variables)
+        future = context.prefetched.pop(plan_key, None)
+        if future is None:
+            return None
+
+        if future.done():
+            self._count(hits=1)
+            return None if future.cancelled() else future.result()
+
+        try:
+            text = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), remaining())
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._count(timed_out=1)
+            return None
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Cancelled by replan() while we waited; already counted as discarded
+                return None
+            # The turn itself is being cancelled, and nobody else can take this reply
+            future.cancel()
+            raise
+
+        self._count(late=1)
+        return text
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+
+        used = stats["hits"] + stats["late"]
+        stats["hit_rate"] = used / stats["started"] if stats["started"] else 0.0
+        return stats
+
+    def _count(self, **deltas: int):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+        for name, delta in deltas.items():
+            if delta:
+                PREFETCH_EVENTS.inc(name, amount=delta)
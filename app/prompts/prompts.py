@@ -89,6 +89,72 @@ It looks like you missed applying your coupon. No worries, though! Your coupon i
         }
     }
     
+    # Conversation stages and the agent method handling input at each stage
+    STAGE_HANDLERS = {
+        "initial": "_handle_items_input",
+        "photo_requested": "_handle_photo_response",
+        "additional_info": "_handle_additional_info",
+        "resolution_choice": "_handle_resolution_choice",
+        "final_resolution": "_handle_final_resolution",
+        "general_chat": "_handle_general_chat",
+        "payment_response": "_handle_payment_followup"
+    }
+    
+    # What each step of a stage handler does to the conversation: the stage it moves to (if any)
+    # and the UI flags merged into the turn result
+    TURN_STEPS = {
+        "items_received": {"stage": "photo_requested", "show_input": False, "show_chat": True},
+        "photo_received": {"stage": "additional_info", "show_chat": True},
+        "reorder_offered": {"show_chat": True},
+        "refund_or_reorder_offered": {"show_chat": True},
+        "report_or_resolve_offered": {"show_chat": False, "show_buttons": True},
+        "reported": {"show_chat": False, "resolved": True},
+        "resolution_requested": {"stage": "final_resolution", "show_chat": True},
+        "resolution_unclear": {"show_chat": True},
+        "reordered": {"show_chat": False, "resolved": True},
+        "reorder_declined": {"show_chat": True},
+        "refunded": {"show_chat": False, "resolved": True},
+        "refund_or_reorder_unclear": {"show_chat": True},
+        "general_answered": {"show_chat": True},
+        "payment_answered": {"stage": "payment_response", "show_chat": True},
+        "payment_escalated": {"show_chat": False, "escalated": True}
+    }
+    
+    # How each item-issue category is resolved once additional info is in:
+    #   reorder           - apologise, then offer a reorder (follow_up is sent as a second message)
+    #   refund_or_reorder - apologise and ask for refund or reorder
+    #   report_or_resolve - apologise and offer report-only or resolution buttons
+    CATEGORY_FLOWS = {
+        "Item(s) portion size is not adequate": {"resolution": "report_or_resolve", "apology": "apology_portion"},
+        "Few item(s) are missing in my order": {"resolution": "reorder", "apology": "apology_missing_first", "follow_up": "reorder_offer_missing_second"},
+        "Item(s) delivered are incorrect or wrong": {"resolution": "refund_or_reorder", "apology": "apology_wrong"},
+        "Item(s) quality is poor": {"resolution": "report_or_resolve", "apology": "apology_quality"},
+        "Item(s) has spillage issue": {"resolution": "report_or_resolve", "apology": "apology_spillage"}
+    }
+    
+    # Prompt keys per payment option; "match" identifies the option in free text
+    PAYMENT_FLOWS = {
+        "I want to know my refund status": {"prompt": "payment_refund_status", "escalation": "escalation_refund_status", "match": "refund status"},
+        "I have payment failure related issues": {"prompt": "payment_failure", "escalation": "escalation_payment_failure", "match": "payment failure"},
+        "I want an invoice for this order": {"prompt": "payment_invoice", "escalation": "escalation_invoice", "match": "invoice"},
+        "I have bill-related issues": {"prompt": "payment_bill_issues", "escalation": "escalation_bill_issues", "match": "bill-related"},
+        "My coupon did not work as expected": {"prompt": "payment_coupon_not_work", "escalation": "escalation_coupon", "match": "coupon did not work"}
+    }
+    
+    # Keyword phrases per free-text intent for resolution choices
+    INTENT_KEYWORDS = {
+        "report": ["only want to report", "report this issue", "just report", "only report", "report it", "report"],
+        "resolution": ["still like a resolution", "resolution for this issue", "want a resolution", "resolution", "resolve", "fix this"],
+        "refund": ["refund", "refund please", "money back", "my money back", "return my money", "return the money"],
+        "reorder": ["reorder", "re-order", "re order", "order again", "send again", "send it again", "deliver again",
+                    "new order", "replace", "replacement", "send the missing"],
+        "affirm": ["yes", "yeah", "yep", "yup", "sure", "ok", "okay", "please do", "go ahead", "sounds good"],
+        "decline": ["no", "nope", "no thanks", "not now", "not needed"]
+    }
+    
+    # Bare yes/no carries less weight than a named resolution ("no, reorder" means reorder)
+    INTENT_WEIGHTS = {"affirm": 0.5, "decline": 0.5}
+    
     AI_PROMPTS = {
         "photo_request": "Generate a natural customer support message asking for photo of {items} to share feedback with restaurant partner. Keep it 1-2 lines and professional.",
         
@@ -113,6 +179,7 @@ It looks like you missed applying your coupon. No worries, though! Your coupon i
         
         "order_query_response": "Customer asks order-related question: {query}. Respond helpfully in 1-2 lines as a professional customer support agent for food delivery app.",
         "redirect_non_order": "Customer asked: {query}. Generate a polite 1-line response redirecting them to ask only order-related questions as you're a customer support bot for food delivery.",
+        "relevance_check": "Is this query related to food delivery, order issues, refunds, delivery status, payment issues, or customer support for food delivery apps? Query: \"{query}\". Answer only: YES or NO",
         
         "payment_refund_status": "Customer wants to know refund status. Generate a helpful 2-3 line response explaining how to check refund status and typical timelines, like a professional customer support agent.",
         "payment_failure": "Customer has payment failure issues. Generate a helpful 2-3 line response about payment failure troubleshooting and next steps, like a professional customer support agent.",
@@ -127,6 +194,113 @@ It looks like you missed applying your coupon. No worries, though! Your coupon i
         "escalation_coupon": "Generate a professional 1-line message about connecting customer with support team for further assistance with their coupon issue."
     }
     
+    # How much a prompt's reply is worth an upstream call while the LLM is slow or failing:
+    #   critical - always generated
+    #   standard - answered locally once latency or errors reach twice the SLO
+    #   optional - answered locally as soon as the SLO is broken
+    PROMPT_CRITICALITY = {
+        "photo_request": "critical",
+        "resolution_acknowledge": "critical",
+        "order_query_response": "critical",
+        "payment_refund_status": "critical",
+        "payment_failure": "critical",
+        "payment_invoice": "critical",
+        "payment_bill_issues": "critical",
+        "payment_coupon_not_work": "critical",
+        "apology_portion": "standard",
+        "apology_quality": "standard",
+        "apology_spillage": "standard",
+        "apology_missing_first": "standard",
+        "reorder_offer_missing_second": "standard",
+        "apology_wrong": "standard",
+        "redirect_non_order": "standard",
+        "relevance_check": "standard",
+        "restaurant_policy_intro": "optional",
+        "restaurant_policy_alternative": "optional",
+        "report_thanks": "optional",
+        "refund_feedback_final": "optional",
+        "reorder_feedback_final": "optional",
+        "escalation_refund_status": "optional",
+        "escalation_payment_failure": "optional",
+        "escalation_invoice": "optional",
+        "escalation_bill_issues": "optional",
+        "escalation_coupon": "optional"
+    }
+    
+    # Offline replies per AI_PROMPTS key, rendered by the template backend with the prompt's variables
+    TEMPLATE_RESPONSES = {
+        "photo_request": "Could you please share a photo of the {items}? It will help us pass your feedback on to the restaurant partner.",
+        
+        "apology_portion": "We're sorry the portion size didn't meet your expectations.",
+        "apology_quality": "We're sorry the food quality didn't meet your expectations.",
+        "apology_spillage": "We're really sorry your order arrived with spillage.",
+        
+        "apology_missing_first": "We're sorry that {items} went missing from your order, and we'll share this with our delivery partner so it doesn't happen again.",
+        "reorder_offer_missing_second": "We can reorder {items} for you right away and have it delivered quickly. Shall we go ahead?",
+        
+        "apology_wrong": "We're sorry you received the wrong items. We'll pass this feedback on to the restaurant partner.",
+        
+        "restaurant_policy_intro": "We've checked with the restaurant regarding this issue.",
+        "restaurant_policy_alternative": "If you'd like us to take this further, drop us an email and we'll escalate it for you.",
+        
+        "resolution_acknowledge": "We'd be happy to resolve this for {items}. Would you prefer a refund or a reorder?",
+        
+        "report_thanks": "Thank you for reporting this. We'll share it with the restaurant partner so they can improve.",
+        
+        "refund_feedback_final": "Sorry again for the trouble with {items}. We'll share your feedback with the restaurant partner to improve quality.",
+        "reorder_feedback_final": "Sorry again for the inconvenience with {items}. We'll inform our delivery partner to prevent this in future.",
+        
+        "order_query_response": "Thanks for reaching out about this. You can track your order and refunds from the Orders section, and we're here if you need anything else.",
+        "redirect_non_order": "I can only help with questions about your food orders, so please let me know if there's anything about an order I can help with.",
+        "relevance_check": "{verdict}",
+        
+        "payment_refund_status": "You can check your refund status under Orders > Help on this order. Refunds usually reach your account within 5-7 business days.",
+        "payment_failure": "If money was deducted for a failed payment, it is refunded automatically within 5-7 business days. Please retry with another payment method meanwhile.",
+        "payment_invoice": "You can download the invoice from the order details page under Orders. It is also sent to your registered email.",
+        "payment_bill_issues": "Please check the bill breakdown on the order details page. If something still looks wrong, we'll review the charges for you.",
+        "payment_coupon_not_work": "Coupons only apply when all their terms are met, which you can review under APPLY COUPON > MORE. If it should have applied, we'll look into it.",
+        
+        "escalation_refund_status": "I'm connecting you with our support team to help further with your refund status.",
+        "escalation_payment_failure": "I'm connecting you with our support team to help further with your payment failure.",
+        "escalation_invoice": "I'm connecting you with our support team to help further with your invoice request.",
+        "escalation_bill_issues": "I'm connecting you with our support team to help further with your billing issue.",
+        "escalation_coupon": "I'm connecting you with our support team to help further with your coupon issue."
+    }
+    
+    # Prompts without {placeholders} produce interchangeable replies and are served from the response pool
+    STATIC_PROMPT_KEYS = frozenset(key for key, prompt in AI_PROMPTS.items() if "{" not in prompt)
+    
+    # Scheduling priority per prompt key when LLM calls queue for rate limits; lower is served first.
+    # Escalations and the replies that move a complaint towards resolution go ahead of closing pleasantries.
+    PROMPT_PRIORITY = {
+        "escalation_refund_status": 0,
+        "escalation_payment_failure": 0,
+        "escalation_invoice": 0,
+        "escalation_bill_issues": 0,
+        "escalation_coupon": 0,
+        "resolution_acknowledge": 0,
+        "payment_refund_status": 0,
+        "payment_failure": 0,
+        "payment_invoice": 0,
+        "payment_bill_issues": 0,
+        "payment_coupon_not_work": 0,
+        "photo_request": 1,
+        "apology_portion": 1,
+        "apology_quality": 1,
+        "apology_spillage": 1,
+        "apology_missing_first": 1,
+        "reorder_offer_missing_second": 1,
+        "apology_wrong": 1,
+        "restaurant_policy_intro": 1,
+        "restaurant_policy_alternative": 1,
+        "order_query_response": 1,
+        "redirect_non_order": 1,
+        "relevance_check": 1,
+        "report_thanks": 2,
+        "refund_feedback_final": 2,
+        "reorder_feedback_final": 2
+    }
+    
     @staticmethod
     def generate_refund_details(items: str) -> str:
         """Generate random refund details"""
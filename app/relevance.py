@@ -0,0 +1,93 @@
+import math
+import re
+import threading
+from typing import Dict, Optional
+
+from app.metrics import registry
+
+# Hand-tuned log-odds weights for unigrams and bigrams; positive means order-related
+FEATURE_WEIGHTS = {
+    # Orders and delivery
+    "order": 2.0, "orders": 2.0, "ordered": 2.0, "reorder": 2.5, "delivery": 2.5, "deliver": 2.0,
+    "delivered": 2.5, "rider": 2.0, "driver": 1.5, "partner": 1.0, "restaurant": 2.0, "food": 1.5,
+    "meal": 1.5, "items": 1.0, "item": 1.0, "missing": 2.0, "late": 1.5, "delayed": 2.0, "delay": 2.0,
+    "eta": 2.0, "track": 1.5, "tracking": 2.0, "arrive": 1.5, "arrived": 1.5, "cold": 1.0,
+    "spilled": 2.0, "spillage": 2.0, "wrong": 1.0, "quantity": 1.5, "portion": 1.5, "quality": 1.0,
+    "cancel": 2.0, "cancelled": 2.0, "cancellation": 2.0, "address": 1.5, "swiggy": 2.5,
+    "where is": 1.0, "my order": 2.0, "my food": 2.0, "not received": 2.5, "not delivered": 2.5,
+    # Payments and billing
+    "refund": 3.0, "refunded": 3.0, "payment": 2.5, "paid": 1.5, "pay": 1.0, "charged": 2.0,
+    "bill": 2.0, "billing": 2.0, "invoice": 2.5, "receipt": 2.0, "coupon": 2.5, "discount": 1.5,
+    "promo": 1.5, "cashback": 2.0, "wallet": 1.5, "upi": 2.0, "card": 1.0, "money": 1.0,
+    "amount": 1.0, "deducted": 2.5, "double charged": 2.0,
+    # Support
+    "support": 1.0, "complaint": 1.5, "help": 0.5, "issue": 0.5, "problem": 0.5, "agent": 0.5,
+    # Off-topic
+    "weather": -3.0, "movie": -3.0, "movies": -3.0, "song": -3.0, "music": -2.5, "joke": -3.0,
+    "poem": -3.0, "story": -2.0, "cricket": -3.0, "football": -3.0, "match": -1.5, "score": -1.5,
+    "politics": -3.0, "election": -3.0, "president": -2.5, "minister": -2.5, "capital": -2.0,
+    "python": -3.0, "code": -2.5, "program": -2.0, "homework": -3.0, "math": -2.5, "translate": -2.5,
+    "stock": -2.5, "crypto": -3.0, "bitcoin": -3.0, "game": -2.0, "news": -2.0, "girlfriend": -3.0,
+    "boyfriend": -3.0, "love": -1.5, "recipe": -1.5, "who are you": -1.0, "meaning of": -2.0,
+    "tell me about": -1.0,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+RELEVANCE_VERDICTS = registry.counter("relevance_verdicts_total", "General-chat relevance verdicts, fallback going to the LLM", ("verdict",))
+
+class RelevanceClassifier:
+    """In-process scorer for whether a general-chat query is about food delivery support
+
+    classify() returns True/False when the score is confident and None in the ambiguous band,
+    where callers should fall back to the LLM.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, bias: float = 0.0,
+                 low: float = 0.2, high: float = 0.8):
+        self.weights = weights if weights is not None else FEATURE_WEIGHTS
+        self.bias = bias
+        self.low = low
+        self.high = high
+        self._lock = threading.Lock()
+        self.counters = {"relevant": 0, "irrelevant": 0, "fallback": 0}
+
+    def score(self, text: str) -> float:
+        """Return the probability that text is an order-related query"""
+        tokens = _TOKEN_RE.findall(text.lower())
+        weights = self.weights
+        logit = self.bias
+
+        previous = None
+        for token in tokens:
+            logit += weights.get(token, 0.0)
+            if previous is not None:
+                logit += weights.get(f"{previous} {token}", 0.0)
+            previous = token
+
+        return 1.0 / (1.0 + math.exp(-logit))
+
+    def classify(self, text: str) -> Optional[bool]:
+        """Return True/False for confident verdicts, None when the LLM should decide"""
+        probability = self.score(text)
+
+        if probability >= self.high:
+            verdict, counter = True, "relevant"
+        elif probability <= self.low:
+            verdict, counter = False, "irrelevant"
+        else:
+            verdict, counter = None, "fallback"
+
+        with self._lock:
+            self.counters[counter] += 1
+        RELEVANCE_VERDICTS.inc(counter)
+
+        return verdict
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self.counters)
+
+        total = sum(counters.values())
+        counters["fallback_rate"] = counters["fallback"] / total if total else 0.0
+        return counters
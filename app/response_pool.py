@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app import runtime
+
+class _PoolEntry:
+    __slots__ = ("prompt", "variants")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.variants: List[Tuple[str, float]] = []
+
+class ResponsePool:
+    """Pre-generated response variants for input-independent prompts, keyed by prompt key"""
+
+    def __init__(self, generate: Callable[[str, str], Awaitable[str]], variants: int = 5,
+                 ttl: float = 1800.0, max_keys: int = 64):
+        self.generate = generate
+        self.variants = variants
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._refilling: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, prompt: str) -> Optional[str]:
+        """Return a random fresh variant for key, scheduling a refill when the pool runs low"""
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entry(key, prompt)
+            entry.variants = [v for v in entry.variants if now - v[1] < self.ttl]
+            choice = random.choice(entry.variants)[0] if entry.variants else None
+            needs_refill = len(entry.variants) < self.variants and not self._refilling.get(key)
+            if needs_refill:
+                self._refilling[key] = True
+
+            if choice is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if needs_refill:
+            runtime.submit(self._refill(key))
+
+        return choice
+
+    def add(self, key: str, prompt: str, text: str):
+        """Store a generated variant for key"""
+        with self._lock:
+            entry = self._entry(key, prompt)
+            if len(entry.variants) < self.variants and all(v[0] != text for v in entry.variants):
+                entry.variants.append((text, time.monotonic()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "keys": len(self._entries),
+                "variants": sum(len(e.variants) for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _entry(self, key: str, prompt: str) -> _PoolEntry:
+        """Look up or create the entry for key and mark it most recently used (lock held)"""
+        entry = self._entries.get(key)
+
+        if entry is None or entry.prompt != prompt:
+            entry = _PoolEntry(prompt)
+            self._entries[key] = entry
+
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_keys:
+            evicted, _ = self._entries.popitem(last=False)
+            self._refilling.pop(evicted, None)
+
+        return entry
+
+    async def _refill(self, key: str):
+        """Top the pool for key back up to the target number of variants"""
+        try:
+            for _ in range(self.variants * 2):
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is None or len(entry.variants) >= self.variants:
+                        return
+                    prompt = entry.prompt
+
+                text = await self.generate(key, prompt)
+                self.add(key, prompt, text)
+
+        except Exception as e:
+            print(f"Response pool refill error for {key}: {e}")
+
+        finally:
+            with self._lock:
+                self._refilling.pop(key, None)
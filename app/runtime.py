@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Iterator, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background event loop, starting it on first use"""
+    global _loop
+
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="cs-runtime", daemon=True)
+                thread.start()
+                _loop = loop
+
+    return _loop
+
+def submit(coro: Awaitable[Any]) -> Future:
+    """Schedule a coroutine on the shared loop and return a concurrent future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """Run a coroutine on the shared loop and block the calling thread for its result"""
+    loop = get_loop()
+
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+
+    if running is loop:
+        raise RuntimeError("run_sync() cannot be called from the runtime loop, await the coroutine instead")
+
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+async def _anext(iterator: AsyncIterator[Any]) -> Any:
+    return await iterator.__anext__()
+
+def iterate_sync(iterable: AsyncIterable[Any]) -> Iterator[Any]:
+    """Drive an async iterable on the shared loop and yield its items to a synchronous caller"""
+    loop = get_loop()
+    iterator = iterable.__aiter__()
+
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(_anext(iterator), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
+
+async def run(coro: Awaitable[Any]) -> Any:
+    """Await a coroutine on the shared loop from any other event loop"""
+    loop = get_loop()
+
+    if asyncio.get_running_loop() is loop:
+        return await coro
+
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+async def aiterate(iterable: AsyncIterable[Any]) -> AsyncIterator[Any]:
+    """Drive an async iterable on the shared loop from any other event loop"""
+    iterator = iterable.__aiter__()
+
+    try:
+        while True:
+            try:
+                yield await run(_anext(iterator))
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await run(aclose())
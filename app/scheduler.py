@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app import runtime
+
+# Lower runs first
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_COSMETIC = 2
+PRIORITY_BACKGROUND = 3
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute; a rate of 0 means unlimited"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount tokens are available (0 if they are available now)"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= amount
+
+class RequestScheduler:
+    """Client-side admission control in front of the LLM API
+
+    Requests wait in a priority queue and are admitted while the AIMD concurrency limit and the
+    requests/tokens-per-minute buckets allow. A 429 halves the limit, a fast success grows it by
+    roughly one per window, and a slow one shrinks it slightly.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, initial_limit: float = 16, min_limit: float = 1,
+                 max_limit: float = 64, target_latency: float = 2.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer_pending = False
+        self._last_decrease = 0.0
+        self._waits: deque = deque(maxlen=1024)
+        self.counters = {"admitted": 0, "rate_limited": 0, "errors": 0, "max_queue_depth": 0}
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, tokens: float = 0) -> float:
+        """Wait for admission and return the time spent queued; pair with release()"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        enqueued = time.monotonic()
+
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._seq), future, loop, tokens))
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], len(self._queue))
+
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as the caller gave up: hand the slot back
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+
+        waited = time.monotonic() - enqueued
+        self._waits.append(waited)
+        return waited
+
+    def release(self, outcome: str, latency: float, estimated_tokens: float = 0, used_tokens: Optional[float] = None):
+        """Report how an admitted request went: outcome is "ok", "rate_limited", "timeout", "error" or "cancelled" """
+        with self._lock:
+            if used_tokens is not None:
+                self.tokens.take(used_tokens - estimated_tokens, time.monotonic())
+
+            if outcome == "rate_limited":
+                self.counters["rate_limited"] += 1
+                now = time.monotonic()
+                # One multiplicative decrease per latency window, however many 429s arrive together
+                if now - self._last_decrease > self.target_latency:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+            elif latency > self.target_latency:
+                # Slow successes and calls abandoned after a timeout both point at an overloaded upstream
+                if outcome in ("ok", "timeout", "cancelled"):
+                    self.limit = max(self.min_limit, self.limit * 0.95)
+            elif outcome == "ok":
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if outcome == "error":
+                self.counters["errors"] += 1
+
+        self._release_slot()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        with self._lock:
+            stats = {
+                **self.counters,
+                "queue_depth": len(self._queue),
+                "in_flight": self.in_flight,
+                "concurrency_limit": round(self.limit, 2)
+            }
+        stats["wait_p50"] = waits[len(waits) // 2] if waits else 0.0
+        stats["wait_p95"] = waits[int(len(waits) * 0.95)] if waits else 0.0
+        stats["wait_max"] = waits[-1] if waits else 0.0
+        return stats
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while capacity allows"""
+        retry_in = 0.0
+
+        with self._lock:
+            while self._queue and self.in_flight < int(self.limit):
+                priority, _, future, loop, tokens = self._queue[0]
+                if future.cancelled():
+                    heapq.heappop(self._queue)
+                    continue
+
+                now = time.monotonic()
+                retry_in = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if retry_in:
+                    break
+
+                heapq.heappop(self._queue)
+                self.requests.take(1, now)
+                self.tokens.take(tokens, now)
+                self.in_flight += 1
+                self.counters["admitted"] += 1
+                loop.call_soon_threadsafe(self._grant, future)
+
+            schedule = retry_in > 0 and not self._timer_pending
+            if schedule:
+                self._timer_pending = True
+
+        if schedule:
+            loop = runtime.get_loop()
+            loop.call_soon_threadsafe(loop.call_later, retry_in, self._on_timer)
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer_pending = False
+        self._dispatch()
+
+    def _grant(self, future: asyncio.Future):
+        if future.done():
+            # The waiter was cancelled before the grant landed
+            self._release_slot()
+        else:
+            future.set_result(None)
@@ -0,0 +1,467 @@
+import queue
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+EvictHook = Callable[[Any, str], None]
+
+def approx_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate deep size in bytes of an object graph made of builtins and plain objects"""
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        if hasattr(obj, "__dict__"):
+            size += approx_size(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += approx_size(getattr(obj, slot), seen)
+
+    return size
+
+class SessionStore:
+    """In-memory session registry with idle-TTL expiry and an LRU cap on live sessions"""
+
+    def __init__(self, idle_ttl: float = 1800.0, max_sessions: int = 10000, sweep_interval: float = 60.0):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self._expired: "OrderedDict[str, str]" = OrderedDict()
+        self._hooks: List[EvictHook] = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self.evictions = {"idle": 0, "capacity": 0}
+
+    def add_evict_hook(self, hook: EvictHook):
+        """Register hook(context, reason) called for every evicted session; reason is "idle" or "capacity" """
+        self._hooks.append(hook)
+
+    def add(self, session_id: str, context: Any):
+        evicted = []
+
+        with self._lock:
+            self._sessions[session_id] = context
+            self._sessions.move_to_end(session_id)
+            self._last_seen[session_id] = time.monotonic()
+
+            while len(self._sessions) > self.max_sessions:
+                oldest = next(iter(self._sessions))
+                evicted.append(self._evict(oldest, "capacity"))
+
+        self._run_hooks(evicted)
+        self._start_sweeper()
+
+    def get(self, session_id: str) -> Optional[Any]:
+        """Return the live session and mark it as recently used, or None if missing or expired"""
+        evicted = []
+
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                return None
+
+            now = time.monotonic()
+            if now - self._last_seen[session_id] > self.idle_ttl:
+                evicted.append(self._evict(session_id, "idle"))
+                context = None
+            else:
+                self._last_seen[session_id] = now
+                self._sessions.move_to_end(session_id)
+
+        self._run_hooks(evicted)
+        return context
+
+    def save(self, context: Any):
+        """Persist changes made to a session during a turn (no-op for the in-memory store)"""
+
+    def remove(self, session_id: str) -> Optional[Any]:
+        with self._lock:
+            self._last_seen.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+    def is_expired(self, session_id: str) -> bool:
+        """True if session_id was evicted recently (as opposed to never having existed)"""
+        with self._lock:
+            return session_id in self._expired
+
+    def sweep(self) -> int:
+        """Evict every session idle for longer than idle_ttl and return how many were evicted"""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = []
+
+        with self._lock:
+            # Sessions are kept in access order, so idle ones are at the front
+            for session_id in list(self._sessions):
+                if self._last_seen[session_id] > cutoff:
+                    break
+                evicted.append(self._evict(session_id, "idle"))
+
+        self._run_hooks(evicted)
+        return len(evicted)
+
+    def approx_memory(self, sample: int = 100) -> int:
+        """Approximate bytes held by live sessions, extrapolated from a random sample"""
+        with self._lock:
+            contexts = list(self._sessions.values())
+
+        if not contexts:
+            return 0
+
+        picked = random.sample(contexts, min(sample, len(contexts)))
+        average = sum(approx_size(context) for context in picked) / len(picked)
+        return int(average * len(contexts))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {"active": len(self._sessions), **self.evictions}
+        stats["approx_bytes"] = self.approx_memory()
+        return stats
+
+    def close(self):
+        self._stop.set()
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self, session_id: str, reason: str) -> tuple:
+        """Drop a session and remember its id as expired (lock held)"""
+        context = self._sessions.pop(session_id)
+        self._last_seen.pop(session_id, None)
+        self.evictions[reason] += 1
+
+        self._expired[session_id] = reason
+        while len(self._expired) > self.max_sessions:
+            self._expired.popitem(last=False)
+
+        return context, reason
+
+    def _run_hooks(self, evicted: List[tuple]):
+        for context, reason in evicted:
+            for hook in self._hooks:
+                try:
+                    hook(context, reason)
+                except Exception as e:
+                    print(f"Session evict hook error: {e}")
+
+    def _start_sweeper(self):
+        if self._sweeper is not None:
+            return
+
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    collected_items TEXT NOT NULL,
+    payment_option TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    followup TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+RestoreFn = Callable[[Dict[str, Any], List[tuple]], Any]
+
+class SQLiteSessionStore(SessionStore):
+    """SessionStore persisted to a local SQLite database in WAL mode
+
+    The in-memory LRU of the base class acts as a hot read cache. save() only enqueues the
+    session row and its new messages; a background writer flushes them in batched transactions
+    so a turn never waits on the disk. Processes sharing the same database file see each other's
+    sessions once the writer has flushed (flush_interval bounds the lag).
+
+    A cached session is checked against the database for changes made by another process at
+    most once every recheck_interval seconds, and never right after this process saved it, so
+    hot sessions are served from memory. The check uses a short busy timeout and keeps the
+    cached copy if the database is locked.
+
+    A session pushed out of the cache by max_sessions is only a cache miss and is loaded again on
+    its next turn. One that idles out while not cached is found by sweep(), which runs the evict
+    hooks for it with reason "idle" like for a cached one.
+    """
+
+    def __init__(self, path: str, restore: RestoreFn, idle_ttl: float = 1800.0, max_sessions: int = 10000,
+                 sweep_interval: float = 60.0, batch_size: int = 256, flush_interval: float = 0.05,
+                 history_limit: Optional[int] = None, recheck_interval: float = 1.0, read_timeout: float = 0.1):
+        super().__init__(idle_ttl, max_sessions, sweep_interval)
+        self.path = path
+        self.restore = restore
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.history_limit = history_limit
+        self.recheck_interval = recheck_interval
+        self.read_timeout = read_timeout
+        self._persisted: Dict[str, int] = {}
+        # session_id -> monotonic time its cached copy was last known to be current
+        self._checked: Dict[str, float] = {}
+        self._local = threading.local()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        # Sessions last updated before this had idled out by the previous sweep
+        self._swept_until = time.time() - idle_ttl
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Databases created before follow-ups were persisted lack the column
+            if "followup" not in [column[1] for column in conn.execute("PRAGMA table_info(sessions)")]:
+                conn.execute("ALTER TABLE sessions ADD COLUMN followup TEXT")
+
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def get(self, session_id: str) -> Optional[Any]:
+        context = super().get(session_id)
+
+        if context is not None:
+            if not self._is_stale(session_id, context):
+                return context
+
+        elif super().is_expired(session_id):
+            return None
+
+        context = self._load(session_id)
+        if context is not None:
+            with self._lock:
+                self._persisted[session_id] = context.message_count
+                self._checked[session_id] = time.monotonic()
+            super().add(session_id, context)
+
+        return context
+
+    def _is_stale(self, session_id: str, context: Any) -> bool:
+        """True if another worker advanced a cached session since we last checked it"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(session_id, 0.0) < self.recheck_interval:
+                return False
+            self._checked[session_id] = now
+
+        try:
+            row = self._reader().execute(
+                "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            print(f"Session store read error: {e}")
+            return False
+
+        return row is not None and row[0] > context.message_count
+
+    def sweep(self) -> int:
+        """Evict idle cached sessions, then run the evict hooks for uncached ones that idled out since the last sweep"""
+        evicted = super().sweep()
+        cutoff = time.time() - self.idle_ttl
+
+        try:
+            rows = self._reader().execute(
+                "SELECT session_id FROM sessions WHERE updated_at >= ? AND updated_at < ?", (self._swept_until, cutoff)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Session store read error: {e}")
+            return evicted
+        self._swept_until = cutoff
+
+        expired = []
+        for (session_id,) in rows:
+            with self._lock:
+                if session_id in self._sessions or session_id in self._expired:
+                    continue
+            try:
+                context = self._load(session_id, expired=True)
+            except sqlite3.OperationalError as e:
+                print(f"Session store read error: {e}")
+                continue
+            if context is not None:
+                expired.append((context, "idle"))
+
+        self._run_hooks(expired)
+        return evicted + len(expired)
+
+    def save(self, context: Any):
+        session_id = context.session_id
+        count = context.message_count
+
+        with self._lock:
+            persisted = self._persisted.get(session_id, 0)
+            self._persisted[session_id] = count
+            self._checked[session_id] = time.monotonic()
+
+        new = list(context.conversation_history)[-(count - persisted):] if count > persisted else []
+        first_seq = count - len(new)
+
+        row = (session_id, context.selected_category, context.stage, context.collected_items,
+               context.payment_option, count, time.time(), context.followup)
+        messages = [(session_id, first_seq + i, m.role, m.content, m.timestamp) for i, m in enumerate(new)]
+        self._queue.put((row, messages))
+
+    def remove(self, session_id: str) -> Optional[Any]:
+        with self._lock:
+            self._persisted.pop(session_id, None)
+            self._checked.pop(session_id, None)
+        return super().remove(session_id)
+
+    def is_expired(self, session_id: str) -> bool:
+        if super().is_expired(session_id):
+            return True
+
+        row = self._reader().execute(
+            "SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None and time.time() - row[0] > self.idle_ttl
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        self._queue.join()
+
+    def close(self):
+        super().close()
+        self._queue.put(None)
+        self._writer.join()
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        stats["pending_writes"] = self._queue.qsize()
+        return stats
+
+    def _evict(self, session_id: str, reason: str) -> tuple:
+        self._persisted.pop(session_id, None)
+        self._checked.pop(session_id, None)
+        evicted = super()._evict(session_id, reason)
+        if reason != "idle":
+            # Only dropped from the hot cache: the next get() loads it from the database again
+            self._expired.pop(session_id, None)
+        return evicted
+
+    def _connect(self, timeout: float = 30) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Per-thread read connection; reads run on the event loop, so they wait briefly on locks"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect(self.read_timeout)
+        return conn
+
+    def _load(self, session_id: str, expired: bool = False) -> Optional[Any]:
+        """Restore a session from the database; one idle for longer than idle_ttl only when expired is set"""
+        conn = self._reader()
+        row = conn.execute(
+            "SELECT category, stage, collected_items, payment_option, message_count, updated_at, followup "
+            "FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+
+        if row is None or (not expired and time.time() - row[5] > self.idle_ttl):
+            return None
+
+        query = "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY seq"
+        params: tuple = (session_id,)
+        if self.history_limit:
+            query = ("SELECT role, content, timestamp FROM (SELECT * FROM messages WHERE session_id = ? "
+                     "ORDER BY seq DESC LIMIT ?) ORDER BY seq")
+            params = (session_id, self.history_limit)
+
+        record = {
+            "session_id": session_id,
+            "category": row[0],
+            "stage": row[1],
+            "collected_items": row[2],
+            "payment_option": row[3],
+            "message_count": row[4],
+            "followup": row[6]
+        }
+        return self.restore(record, conn.execute(query, params).fetchall())
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write(conn, batch)
+            except Exception as e:
+                print(f"Session store write error: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[tuple]):
+        """Commit a batch of session rows and history appends in one transaction"""
+        rows = {}
+        messages = []
+        for row, new_messages in batch:
+            rows[row[0]] = row
+            messages.extend(new_messages)
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (session_id, category, stage, collected_items, payment_option, "
+                "message_count, updated_at, followup) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                "stage = excluded.stage, collected_items = excluded.collected_items, "
+                "payment_option = excluded.payment_option, message_count = excluded.message_count, "
+                "updated_at = excluded.updated_at, followup = excluded.followup",
+                rows.values()
+            )
+            conn.executemany("INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)", messages)
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set
+
+def _retrieve(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one upstream execution
+
+    The first caller for a key starts the call as a detached task; everyone arriving before it
+    finishes awaits the same concurrent.futures.Future, so callers on any thread or event loop
+    share the result (or the exception). A cancelled waiter does not cancel the shared call.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters["leaders"] += 1
+            else:
+                self.counters["followers"] += 1
+
+        if leader:
+            task = asyncio.ensure_future(self._run(key, future, fn))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        shared = asyncio.wrap_future(future)
+        # Left behind when this waiter is cancelled through the shield, so its exception is retrieved here
+        shared.add_done_callback(_retrieve)
+        return await asyncio.shield(shared)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "in_flight": len(self._calls)}
+
+    async def _run(self, key: Hashable, future: Future, fn: Callable[[], Awaitable[Any]]):
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
@@ -0,0 +1,442 @@
+"""Memory-mapped index over the transcript segments written by TranscriptSink
+
+build_index() streams every completed segment, spilling message batches to a temporary file so
+only per-session offsets stay in memory, and writes one row per session into fixed-width column
+files, sorted by (category, ended_at):
+
+    session_id.bin (16-byte UUIDs)   started_at.f64   ended_at.f64   message_count.u32   stage.u16
+    resolved.u8   escalated.u8   outcome.u8   data_offset.u64   data_length.u32
+
+plus by_id.bin (UUID and row number, sorted by UUID) for lookups by session id, transcripts.bin
+(each session's messages as zlib-compressed JSON) and meta.json (category, stage and outcome names and
+each category's row range). TranscriptIndex maps the files read-only: a category is a contiguous row
+range, a time range within it is a bisect on ended_at, and aggregates count bytes in the flag columns,
+so queries touch only the rows they need.
+
+Rebuild periodically. Each build writes a new <index>.v<timestamp>-<suffix> directory and then swaps
+the <index> symlink over to it with os.replace, so readers always find a complete index; the
+version it replaced is deleted by the build after.
+
+CLI (TRANSCRIPT_DIR and TRANSCRIPT_INDEX_DIR provide the defaults):
+
+    python -m app.transcript_index build
+    python -m app.transcript_index get 3f0c...
+    python -m app.transcript_index find --category "Item(s) has spillage issue" --day 2026-10-18
+    python -m app.transcript_index stats --day 2026-10-18
+"""
+import argparse
+import bisect
+import gzip
+import json
+import marshal
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from app.transcripts import SEGMENT_SUFFIX
+
+# Column name -> array typecode; session_id is stored separately as raw 16-byte UUIDs
+COLUMNS = {
+    "started_at": "d",
+    "ended_at": "d",
+    "message_count": "I",
+    "stage": "H",
+    "resolved": "B",
+    "escalated": "B",
+    "outcome": "B",
+    "data_offset": "Q",
+    "data_length": "I"
+}
+ID_RECORD = 20  # 16-byte UUID + uint32 row
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+class _SessionScan:
+    """What a build keeps in memory per session while scanning segments"""
+    __slots__ = ("category", "end", "chunks", "first", "last")
+
+    def __init__(self, category: str):
+        self.category = category
+        self.end: Optional[Dict[str, Any]] = None
+        # (first_seq, offset, length) of each message batch in the spill file, in segment order
+        self.chunks: List[Tuple[int, int, int]] = []
+        # (seq, timestamp) of the earliest and latest message seen
+        self.first: Optional[Tuple[int, float]] = None
+        self.last: Optional[Tuple[int, float]] = None
+
+def _scan_segments(transcript_dir: str, spill: BinaryIO) -> Dict[str, _SessionScan]:
+    """Fold every completed segment into one entry per session (later end records win)
+
+    Message batches are copied to spill as they are read, so only their offsets stay in memory. They
+    are marshalled rather than re-encoded as JSON, which makes reading them back cheap.
+    """
+    sessions: Dict[str, _SessionScan] = {}
+    offset = 0
+
+    for name in sorted(os.listdir(transcript_dir)):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+
+        with gzip.open(os.path.join(transcript_dir, name), "rt", encoding="utf-8") as segment:
+            for line in segment:
+                record = json.loads(line)
+                session = sessions.get(record["session_id"])
+                if session is None:
+                    session = sessions[record["session_id"]] = _SessionScan(record["category"])
+
+                if record["type"] == "end":
+                    session.end = record
+                    continue
+
+                messages = record["messages"]
+                if record["type"] != "messages" or not messages:
+                    continue
+
+                first_seq = record["first_seq"]
+                blob = marshal.dumps(messages)
+                spill.write(blob)
+                session.chunks.append((first_seq, offset, len(blob)))
+                offset += len(blob)
+
+                last_seq = first_seq + len(messages) - 1
+                if session.first is None or first_seq < session.first[0]:
+                    session.first = (first_seq, messages[0][2])
+                if session.last is None or last_seq > session.last[0]:
+                    session.last = (last_seq, messages[-1][2])
+
+    return sessions
+
+def _read_messages(spill: Any, session: _SessionScan) -> List[list]:
+    """A session's messages from the spill file in seq order, later copies of a seq winning"""
+    messages: Dict[int, list] = {}
+    for first_seq, offset, length in session.chunks:
+        for i, message in enumerate(marshal.loads(spill[offset:offset + length])):
+            messages[first_seq + i] = message
+    return [messages[seq] for seq in sorted(messages)]
+
+def _swap(index_dir: str, version_dir: str):
+    """Point the index_dir symlink at version_dir in one rename and drop older versions
+
+    The version it replaces is kept until the next build, for readers that resolved the link just before.
+    """
+    parent = os.path.dirname(index_dir) or "."
+    prefix = os.path.basename(index_dir) + ".v"
+
+    previous = None
+    if os.path.islink(index_dir):
+        previous = os.path.basename(os.path.realpath(index_dir))
+    elif os.path.isdir(index_dir):
+        # Built before indexes were versioned: move it aside once, which readers may notice
+        previous = prefix + "0-unversioned"
+        os.rename(index_dir, os.path.join(parent, previous))
+
+    link = f"{index_dir}.link-{os.getpid()}"
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, index_dir)
+
+    for name in os.listdir(parent):
+        if name.startswith(prefix) and name not in (os.path.basename(version_dir), previous):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+def build_index(transcript_dir: str, index_dir: str) -> Dict[str, Any]:
+    """Index every completed segment in transcript_dir and switch index_dir over to it"""
+    started = time.perf_counter()
+    index_dir = index_dir.rstrip("/")
+    parent = os.path.dirname(index_dir) or "."
+    os.makedirs(parent, exist_ok=True)
+    version_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(index_dir)}.v{time.strftime('%Y%m%d-%H%M%S')}-", dir=parent)
+    os.chmod(version_dir, 0o755)
+
+    spill_path = os.path.join(version_dir, "messages.spill")
+    with open(spill_path, "wb") as spill:
+        sessions = _scan_segments(transcript_dir, spill)
+
+    categories = sorted({session.category for session in sessions.values()})
+    category_ids = {name: i for i, name in enumerate(categories)}
+    stages, outcomes = ["unknown"], ["open"]
+    rows = []
+
+    for session_id, session in sessions.items():
+        end = session.end or {}
+        stage = end.get("stage") or "unknown"
+        outcome = end.get("outcome") or "open"
+        for names, name in ((stages, stage), (outcomes, outcome)):
+            if name not in names:
+                names.append(name)
+
+        started_at = end.get("started_at") or (session.first[1] if session.first else 0.0)
+        ended_at = end.get("ended_at") or (session.last[1] if session.last else started_at)
+        rows.append((category_ids[session.category], ended_at, uuid.UUID(session_id).bytes, started_at, stage, outcome,
+                     end.get("message_count"), session))
+
+    rows.sort(key=lambda row: (row[0], row[1]))
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    ids = []
+    offset = 0
+    category_rows: Dict[str, List[int]] = {}
+
+    with open(spill_path, "rb") as f, open(os.path.join(version_dir, "transcripts.bin"), "wb") as data:
+        spill: Any = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+        for i, (category, ended_at, key, started_at, stage, outcome, count, session) in enumerate(rows):
+            messages = _read_messages(spill, session)
+            # Level 1: transcripts are small and the build is dominated by compression at higher levels
+            blob = zlib.compress(_ENCODER.encode(messages).encode(), 1)
+            data.write(blob)
+
+            columns["started_at"].append(started_at)
+            columns["ended_at"].append(ended_at)
+            columns["message_count"].append(count or len(messages))
+            columns["stage"].append(stages.index(stage))
+            columns["resolved"].append(outcome == "resolved")
+            columns["escalated"].append(outcome == "escalated")
+            columns["outcome"].append(outcomes.index(outcome))
+            columns["data_offset"].append(offset)
+            columns["data_length"].append(len(blob))
+            offset += len(blob)
+
+            ids.append((key, i))
+            category_rows.setdefault(categories[category], [i, i + 1])[1] = i + 1
+
+        if isinstance(spill, mmap.mmap):
+            spill.close()
+    os.remove(spill_path)
+
+    for name, values in columns.items():
+        with open(os.path.join(version_dir, f"{name}.bin"), "wb") as f:
+            values.tofile(f)
+
+    with open(os.path.join(version_dir, "session_id.bin"), "wb") as f:
+        f.write(b"".join(row[2] for row in rows))
+
+    ids.sort()
+    with open(os.path.join(version_dir, "by_id.bin"), "wb") as f:
+        for key, row in ids:
+            f.write(key + array("I", [row]).tobytes())
+
+    meta = {
+        "rows": len(rows),
+        "categories": category_rows,
+        "stages": stages,
+        "outcomes": outcomes,
+        "built_at": time.time(),
+        "build_seconds": time.perf_counter() - started
+    }
+    with open(os.path.join(version_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Readers holding the old files keep their mappings
+    _swap(index_dir, version_dir)
+
+    return meta
+
+class TranscriptIndex:
+    """Read-only, memory-mapped view of an index written by build_index()"""
+
+    def __init__(self, index_dir: str):
+        # Resolved once, so every file comes from the same build even if a new one is swapped in
+        self.index_dir = os.path.realpath(index_dir)
+        with open(os.path.join(self.index_dir, "meta.json")) as f:
+            meta = json.load(f)
+
+        self.rows = meta["rows"]
+        self.categories: Dict[str, Tuple[int, int]] = {name: tuple(bounds) for name, bounds in meta["categories"].items()}
+        self.stages: List[str] = meta["stages"]
+        self.outcomes: List[str] = meta["outcomes"]
+        self._maps: List[mmap.mmap] = []
+
+        self.columns = {name: self._map(f"{name}.bin", typecode) for name, typecode in COLUMNS.items()}
+        self.session_ids = self._map("session_id.bin")
+        self.by_id = self._map("by_id.bin")
+        self.data = self._map("transcripts.bin")
+
+    def _map(self, name: str, typecode: Optional[str] = None) -> memoryview:
+        with open(os.path.join(self.index_dir, name), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mapped)
+                view = memoryview(mapped)
+        return view.cast(typecode) if typecode else view
+
+    def close(self):
+        for view in [*self.columns.values(), self.session_ids, self.by_id, self.data]:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+
+    def row(self, i: int, messages: bool = False) -> Dict[str, Any]:
+        """One session's indexed fields, and its messages when asked for"""
+        columns = self.columns
+        result = {
+            "session_id": str(uuid.UUID(bytes=bytes(self.session_ids[i * 16:(i + 1) * 16]))),
+            "category": self._category_of(i),
+            "stage": self.stages[columns["stage"][i]],
+            "outcome": self.outcomes[columns["outcome"][i]],
+            "resolved": bool(columns["resolved"][i]),
+            "escalated": bool(columns["escalated"][i]),
+            "message_count": columns["message_count"][i],
+            "started_at": columns["started_at"][i],
+            "ended_at": columns["ended_at"][i]
+        }
+
+        if messages:
+            offset, length = columns["data_offset"][i], columns["data_length"][i]
+            result["messages"] = json.loads(zlib.decompress(self.data[offset:offset + length]))
+        return result
+
+    def _category_of(self, i: int) -> str:
+        for name, (lo, hi) in self.categories.items():
+            if lo <= i < hi:
+                return name
+        return ""
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A session with its messages, by binary search over the sorted id file"""
+        try:
+            key = uuid.UUID(session_id).bytes
+        except ValueError:
+            return None
+
+        lo, hi = 0, len(self.by_id) // ID_RECORD
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self.by_id[mid * ID_RECORD:mid * ID_RECORD + 16]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        start = lo * ID_RECORD
+        if lo * ID_RECORD >= len(self.by_id) or bytes(self.by_id[start:start + 16]) != key:
+            return None
+        return self.row(array("I", bytes(self.by_id[start + 16:start + ID_RECORD]))[0], messages=True)
+
+    def _ranges(self, category: Optional[str], start: Optional[float], end: Optional[float]) -> List[Tuple[str, int, int]]:
+        """Row ranges of the matching categories, narrowed to ended_at in [start, end)"""
+        names = [category] if category is not None else list(self.categories)
+        ended_at = self.columns["ended_at"]
+        ranges = []
+
+        for name in names:
+            if name not in self.categories:
+                continue
+            lo, hi = self.categories[name]
+            if start is not None:
+                lo = bisect.bisect_left(ended_at, start, lo, hi)
+            if end is not None:
+                hi = bisect.bisect_left(ended_at, end, lo, hi)
+            ranges.append((name, lo, hi))
+
+        return ranges
+
+    def find(self, category: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+             resolved: Optional[bool] = None, escalated: Optional[bool] = None, stage: Optional[str] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """Sessions matching every given filter, most recently ended first"""
+        if stage is not None and stage not in self.stages:
+            return []
+
+        columns = self.columns
+        stage_id = self.stages.index(stage) if stage is not None else None
+        matches = []
+
+        for _, lo, hi in self._ranges(category, start, end):
+            found = 0
+            for i in range(hi - 1, lo - 1, -1):
+                if ((resolved is None or bool(columns["resolved"][i]) == resolved) and
+                        (escalated is None or bool(columns["escalated"][i]) == escalated) and
+                        (stage_id is None or columns["stage"][i] == stage_id)):
+                    matches.append(i)
+                    found += 1
+                    if found == limit:
+                        break
+
+        matches.sort(key=lambda i: columns["ended_at"][i], reverse=True)
+        return [self.row(i) for i in matches[:limit]]
+
+    def aggregate(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Per-category session counts, resolution and escalation rates and mean messages"""
+        columns = self.columns
+        result = {}
+
+        for name, lo, hi in self._ranges(None, start, end):
+            sessions = hi - lo
+            if not sessions:
+                continue
+            resolved = columns["resolved"][lo:hi].tobytes().count(1)
+            escalated = columns["escalated"][lo:hi].tobytes().count(1)
+            result[name] = {
+                "sessions": sessions,
+                "resolved": resolved,
+                "escalated": escalated,
+                "resolution_rate": resolved / sessions,
+                "escalation_rate": escalated / sessions,
+                "avg_messages": sum(columns["message_count"][lo:hi]) / sessions
+            }
+
+        return result
+
+def _day_range(day: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Epoch bounds of a local calendar day given as YYYY-MM-DD"""
+    if day is None:
+        return None, None
+    start = datetime.strptime(day, "%Y-%m-%d")
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+def main():
+    transcript_dir = os.getenv("TRANSCRIPT_DIR", "transcripts")
+
+    parser = argparse.ArgumentParser(prog="python -m app.transcript_index")
+    parser.add_argument("--index", default=os.getenv("TRANSCRIPT_INDEX_DIR", os.path.join(transcript_dir, "index")))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="index the completed transcript segments")
+    build.add_argument("--transcripts", default=transcript_dir)
+
+    get = commands.add_parser("get", help="one session with its messages")
+    get.add_argument("session_id")
+
+    for name, help in (("find", "sessions matching filters"), ("stats", "per-category aggregates")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("--day", help="YYYY-MM-DD (local time) the session ended on")
+        if name == "find":
+            command.add_argument("--category")
+            command.add_argument("--stage")
+            command.add_argument("--resolved", action=argparse.BooleanOptionalAction, default=None)
+            command.add_argument("--escalated", action=argparse.BooleanOptionalAction, default=None)
+            command.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = build_index(args.transcripts, args.index)
+        print(f"indexed {meta['rows']} sessions in {meta['build_seconds']:.2f}s into {args.index}")
+        return
+
+    started = time.perf_counter()
+    index = TranscriptIndex(args.index)
+    start, end = _day_range(getattr(args, "day", None))
+
+    if args.command == "get":
+        result: Any = index.get(args.session_id)
+    elif args.command == "find":
+        result = index.find(args.category, start, end, args.resolved, args.escalated, args.stage, args.limit)
+    else:
+        result = index.aggregate(start, end)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"({elapsed * 1000:.1f} ms)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
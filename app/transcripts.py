@@ -0,0 +1,268 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.metrics import registry
+
+TRANSCRIPT_MESSAGES = registry.counter("transcript_messages_total", "Transcript messages by what happened to them", ("outcome",))
+TRANSCRIPT_SEGMENTS = registry.counter("transcript_segments_total", "Transcript segment files completed")
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+OPEN_SUFFIX = ".part"
+
+class TranscriptSink:
+    """Append-only archive of conversation transcripts in rotating gzip JSONL segments
+
+    Handlers call record() after a turn and end() when a conversation finishes. Both only copy
+    the new messages onto a bounded in-memory queue; when it is full the record is dropped and
+    counted instead of blocking the turn. A background writer drains the queue in batches into
+    the current segment, flushing the gzip stream after every batch.
+
+    Segments are written as <name>.jsonl.gz.part and renamed to <name>.jsonl.gz once they reach
+    segment_bytes (uncompressed) or segment_seconds, so readers only ever see complete files.
+    Each line is one record:
+
+        {"type": "messages", "session_id", "category", "first_seq", "messages": [[role, content, timestamp], ...]}
+        {"type": "end", "session_id", "category", "stage", "outcome", "resolved", "escalated",
+         "message_count", "started_at", "ended_at"}
+
+    A session's messages are numbered by seq; a session cached out and loaded again may repeat
+    some, so readers de-duplicate on (session_id, seq).
+    """
+
+    def __init__(self, directory: str, max_queue: int = 10000, batch_size: int = 512, flush_interval: float = 1.0,
+                 segment_bytes: int = 64 * 1024 * 1024, segment_seconds: float = 3600.0, enabled: bool = True):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.enabled = enabled
+
+        # session_id -> (messages queued so far, outcome once the conversation finished, end record queued)
+        # Only moved forward after a successful put, so the next call resends what was dropped
+        self._recorded: Dict[str, Tuple[int, Optional[str], bool]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._segment: Optional[gzip.GzipFile] = None
+        self._segment_path = ""
+        self._segment_opened = 0.0
+        self._segment_written = 0
+        self._closed = False
+        # Seconds the writer spent encoding, compressing and writing, for its spare capacity
+        self.write_seconds = 0.0
+        # Message counts, except dropped_records (records of any type) and segments; dropped
+        # messages are resent with the next call, so one may be counted as dropped more than once
+        self.counters = {"queued": 0, "dropped": 0, "written": 0, "dropped_records": 0, "segments": 0}
+
+        if not enabled:
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        registry.gauge("transcript_queue_depth", "Transcript records waiting for the writer", callback=self._queue.qsize)
+        self._writer = threading.Thread(target=self._write_loop, name="transcript-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, context: Any):
+        """Queue the messages a session gained since the last call"""
+        if self.enabled:
+            self._enqueue(context, None)
+
+    def end(self, context: Any, outcome: str):
+        """Queue a session's remaining messages and its end record
+
+        outcome is "resolved" or "escalated" when the conversation finished, "abandoned" when it
+        idled out and "evicted" when it was pushed out of a full session store. A session that
+        already ended is only forgotten when it is evicted later, and one this sink never archived
+        is ignored.
+        """
+        if self.enabled:
+            self._enqueue(context, outcome)
+
+    def flush(self):
+        """Block until every queued record has been written and flushed"""
+        if self.enabled:
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued, complete the current segment and stop the writer"""
+        with self._lock:
+            if not self.enabled or self._closed:
+                return
+            self._closed = True
+
+        self._queue.put(None)
+        self._writer.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["open_sessions"] = len(self._recorded)
+        stats["pending"] = self._queue.qsize()
+        stats["write_seconds"] = self.write_seconds
+        return stats
+
+    def _enqueue(self, context: Any, outcome: Optional[str]):
+        session_id = context.session_id
+        count = context.message_count
+        leaving = outcome in ("abandoned", "evicted")
+
+        with self._lock:
+            if leaving and session_id not in self._recorded:
+                # Archived by another process, or before a restart; that one closes it
+                return
+            recorded, final, ended = self._recorded.get(session_id, (0, None, False))
+
+        if not leaving and outcome is not None:
+            final = outcome
+        if ended:
+            # Finished earlier: only late messages are archived
+            end = None
+        elif leaving:
+            # A finish whose end record was dropped is still reported as such
+            end = final or outcome
+        else:
+            end = final
+
+        new = list(context.conversation_history)[-(count - recorded):] if count > recorded else []
+        if new and self._put({
+            "type": "messages",
+            "session_id": session_id,
+            "category": context.selected_category,
+            "first_seq": count - len(new),
+            "messages": [[m.role, m.content, m.timestamp] for m in new]
+        }, len(new)):
+            recorded = count
+
+        # Without its messages the end waits for the next call, unless the session is leaving
+        if end is not None and (recorded == count or leaving):
+            history = context.conversation_history
+            ended = self._put({
+                "type": "end",
+                "session_id": session_id,
+                "category": context.selected_category,
+                "stage": context.stage,
+                "outcome": end,
+                "resolved": end == "resolved",
+                "escalated": end == "escalated",
+                "message_count": count,
+                "started_at": history[0].timestamp if history else None,
+                "ended_at": time.time()
+            }, 0)
+
+        with self._lock:
+            if leaving:
+                self._recorded.pop(session_id, None)
+            else:
+                self._recorded[session_id] = (recorded, final, ended)
+
+    def _put(self, record: Dict[str, Any], messages: int) -> bool:
+        """Queue a record without blocking; a full queue drops it and returns False"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count("dropped", messages)
+            with self._lock:
+                self.counters["dropped_records"] += 1
+            return False
+
+        self._count("queued", messages)
+        return True
+
+    def _count(self, outcome: str, messages: int):
+        with self._lock:
+            self.counters[outcome] += messages
+        TRANSCRIPT_MESSAGES.inc(outcome, amount=messages)
+
+    def _write_loop(self):
+        stopping = False
+
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._rotate_if_due()
+                continue
+
+            batch: List[Dict[str, Any]] = []
+            done = 1
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                done += 1
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                if batch:
+                    self._write(batch)
+                self._rotate_if_due()
+            except Exception as e:
+                print(f"Transcript write error: {e}")
+            finally:
+                for _ in range(done):
+                    self._queue.task_done()
+
+        try:
+            self._finish_segment()
+        except Exception as e:
+            print(f"Transcript write error: {e}")
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Append a batch of records to the current segment and flush the compressed stream"""
+        started = time.perf_counter()
+        if self._segment is None:
+            self._open_segment()
+
+        data = ("\n".join(map(_ENCODER.encode, batch)) + "\n").encode()
+        self._segment.write(data)
+        self._segment.flush()
+        self._segment_written += len(data)
+        self.write_seconds += time.perf_counter() - started
+        self._count("written", sum(len(record.get("messages", ())) for record in batch))
+
+    def _open_segment(self):
+        name = f"transcripts-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.counters['segments']:04d}"
+        self._segment_path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self._segment = gzip.open(self._segment_path + OPEN_SUFFIX, "wb", compresslevel=6)
+        self._segment_opened = time.monotonic()
+        self._segment_written = 0
+
+    def _rotate_if_due(self):
+        if self._segment is None:
+            return
+        if (self._segment_written >= self.segment_bytes or
+                time.monotonic() - self._segment_opened >= self.segment_seconds):
+            self._finish_segment()
+
+    def _finish_segment(self):
+        if self._segment is None:
+            return
+
+        self._segment.close()
+        os.replace(self._segment_path + OPEN_SUFFIX, self._segment_path)
+        self._segment = None
+        with self._lock:
+            self.counters["segments"] += 1
+        TRANSCRIPT_SEGMENTS.inc()
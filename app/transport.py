@@ -0,0 +1,141 @@
+import importlib.util
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.metrics import registry
+
+HTTP_CONNECTIONS = registry.counter("http_connections_opened_total", "New upstream connections by handshake step", ("step",))
+HTTP_POOL_WAIT = registry.histogram("http_pool_wait_seconds", "Time from sending a request to writing its headers on a connection")
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that records connection-pool saturation
+
+    Every request is traced: new TCP connections and TLS handshakes are counted, and the time a
+    request spends waiting for a free connection (plus connecting, when it opens one) is observed.
+    """
+
+    def __init__(self, limits: httpx.Limits, http2: bool, **kwargs):
+        super().__init__(limits=limits, http2=http2, **kwargs)
+        self.limits = limits
+        self.http2 = http2
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.monotonic()
+        state = {"waiting": True}
+        self.in_flight += 1
+        self.waiting += 1
+        self.requests += 1
+
+        def connected():
+            if state["waiting"]:
+                state["waiting"] = False
+                self.waiting -= 1
+                HTTP_POOL_WAIT.observe(time.monotonic() - started)
+
+        async def trace(event: str, info: Dict[str, Any]):
+            if event == "connection.connect_tcp.complete":
+                HTTP_CONNECTIONS.inc("tcp")
+            elif event == "connection.start_tls.complete":
+                HTTP_CONNECTIONS.inc("tls")
+            elif event.endswith(".send_request_headers.started"):
+                connected()
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            connected()
+            self.in_flight -= 1
+
+    def connections(self) -> int:
+        # _pool is the httpcore pool httpx builds for this transport
+        return len(self._pool.connections)
+
+    def idle_connections(self) -> int:
+        return sum(1 for connection in self._pool.connections if connection.is_idle())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "connections": self.connections(),
+            "idle_connections": self.idle_connections(),
+            "max_connections": self.limits.max_connections,
+            "http2": self.http2,
+            "tcp_connects": HTTP_CONNECTIONS.get("tcp"),
+            "tls_handshakes": HTTP_CONNECTIONS.get("tls")
+        }
+
+def create_transport() -> PooledTransport:
+    """Build the pooled transport from the HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY and HTTP2 settings"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    )
+
+    http2 = os.getenv("HTTP2", "1") == "1"
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("HTTP Error: HTTP2=1 needs the h2 package (pip install 'httpx[http2]'), using HTTP/1.1")
+        http2 = False
+
+    return PooledTransport(limits, http2)
+
+def create_timeout() -> httpx.Timeout:
+    """Upstream timeouts; GroqLLM also bounds each attempt with its own LLM_TIMEOUT"""
+    return httpx.Timeout(
+        float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+        connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+        # How long a request may wait for a free connection when the pool is full
+        pool=float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+    )
+
+def _register_gauges(transport: PooledTransport):
+    registry.gauge("http_pool_connections", "Open upstream connections", callback=transport.connections)
+    registry.gauge("http_pool_idle_connections", "Idle keep-alive upstream connections", callback=transport.idle_connections)
+    registry.gauge("http_requests_in_flight", "Upstream HTTP requests in progress", callback=lambda: transport.in_flight)
+    registry.gauge("http_pool_waiting", "Upstream HTTP requests waiting for a connection", callback=lambda: transport.waiting)
+    registry.gauge("http_pool_max_connections", "Connection pool size", callback=lambda: transport.limits.max_connections)
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[PooledTransport] = None
+_lock = threading.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client shared by all upstream LLM calls
+
+    Sync calls run on the shared runtime loop too, so one async client serves both.
+    """
+    global _client, _transport
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                transport = create_transport()
+                _register_gauges(transport)
+                _transport = transport
+                _client = httpx.AsyncClient(transport=transport, timeout=create_timeout())
+
+    return _client
+
+def stats() -> Dict[str, Any]:
+    """Pool counters of the shared client (empty before its first use)"""
+    transport = _transport
+    return transport.stats() if transport is not None else {}
+
+async def aclose():
+    """Close the shared client's connections, e.g. on shutdown"""
+    global _client, _transport
+
+    with _lock:
+        client, _client, _transport = _client, None, None
+    if client is not None:
+        await client.aclose()
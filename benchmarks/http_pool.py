@@ -0,0 +1,114 @@
+"""Connection reuse of the shared HTTP pool, against a local stub of the chat completions API
+
+A small keep-alive HTTP/1.1 server answers every completion after --latency-ms. GroqBackend talks
+to it through GROQ_BASE_URL with the pooled transport, so the run shows how many connections the
+requests needed and how long they waited for one, for the given HTTP_MAX_CONNECTIONS.
+
+Run from the repo root:  python -m benchmarks.http_pool --requests 2000 --concurrency 200 --max-connections 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from app import runtime
+
+COMPLETION = {
+    "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Stub reply."}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+}
+
+class StubServer:
+    """Keep-alive HTTP/1.1 server replying to every request with a fixed chat completion"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        body = json.dumps(COMPLETION).encode()
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = dict(line.split(": ", 1) for line in head.decode("latin-1").split("\r\n")[1:] if ": " in line)
+                length = int({k.lower(): v for k, v in headers.items()}.get("content-length", "0"))
+                await reader.readexactly(length)
+
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+async def run(args) -> dict:
+    server = StubServer(args.latency_ms / 1000)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+    # Imported after the settings are in place, since the pool reads them when it is first built
+    from app import transport
+    from app.backends import GroqBackend
+
+    backend = GroqBackend(model="stub")
+    messages = [{"role": "user", "content": "Generate a one-line apology."}]
+    gate = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def call():
+        async with gate:
+            started = time.perf_counter()
+            await backend.complete(messages, max_tokens=20)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    stats = transport.stats()
+    await transport.aclose()
+    listener.close()
+    await listener.wait_closed()
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "server_connections": server.connections,
+        "server_requests": server.requests,
+        "pool": stats,
+        "pool_wait_p95": transport.HTTP_POOL_WAIT.quantile(0.95)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="requests in flight at once")
+    parser.add_argument("--max-connections", type=int, default=50, help="HTTP_MAX_CONNECTIONS for the pool")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub server time per completion")
+    args = parser.parse_args()
+
+    os.environ["HTTP_MAX_CONNECTIONS"] = str(args.max_connections)
+    os.environ.setdefault("HTTP_MAX_KEEPALIVE", str(args.max_connections))
+    result = runtime.run_sync(run(args))
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, pool of {args.max_connections}, "
+          f"stub latency {args.latency_ms:.0f}ms")
+    print(f"{args.requests / result['elapsed']:.0f} req/s, p50 {result['p50'] * 1000:.1f}ms, p95 {result['p95'] * 1000:.1f}ms")
+    print(f"connections opened: {result['server_connections']} for {result['server_requests']} requests, "
+          f"pool wait p95 <= {result['pool_wait_p95'] * 1000:.0f}ms")
+    print(f"pool: {result['pool']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Per-turn cost of intent detection: chained substring checks vs the single-pass IntentMatcher
+
+Run from the repo root:  python -m benchmarks.intent_matcher --iterations 200000
+"""
+import argparse
+import time
+
+from app.intents import IntentMatcher
+from app.prompts.prompts import CustomerSupportPrompts
+
+INPUTS = [
+    "I would still like a resolution for this issue",
+    "I only want to report this issue",
+    "Please reorder the missing burger",
+    "I don't want a refund, just send it again",
+    "no refund, reorder please",
+    "yes please",
+    "Can I get my money back for the fries? The whole order was cold and the packaging was torn",
+    "no",
+]
+
+def substring_resolution_choice(user_input: str) -> str:
+    """Intent checks as they were written inline in the handlers"""
+    if "only want to report" in user_input.lower() or "report this issue" in user_input.lower():
+        return "report"
+    elif "still like a resolution" in user_input.lower() or "resolution for this issue" in user_input.lower():
+        return "resolution"
+
+    user_choice = user_input.lower()
+    if "refund" in user_choice:
+        return "refund"
+    elif "reorder" in user_choice or "re-order" in user_choice or "order" in user_choice or "yes" in user_choice or "ok" in user_choice:
+        return "reorder"
+    return ""
+
+def bench(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(INPUTS[i % len(INPUTS)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    matcher = IntentMatcher(CustomerSupportPrompts.INTENT_KEYWORDS, CustomerSupportPrompts.INTENT_WEIGHTS)
+
+    print(f"{'substring chain':<24} {bench(substring_resolution_choice, args.iterations):6.2f} us/turn")
+    print(f"{'IntentMatcher.match':<24} {bench(matcher.match, args.iterations):6.2f} us/turn")
+    print(f"{'IntentMatcher.best':<24} {bench(lambda text: matcher.best(text, ('refund', 'reorder')), args.iterations):6.2f} us/turn")
+    print()
+    for text in INPUTS:
+        print(f"{substring_resolution_choice(text):<10} {str(matcher.match(text)):<40} {text}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Throughput and tail latency of CustomerSupportAgent under a simulated customer population
+
+Every customer walks one flow end to end against the template backend, slowed down to a log-normal
+latency distribution and failing at a set rate, so the run is offline and repeatable with --seed.
+
+Run from the repo root:  python -m benchmarks.load_test --customers 2000 --latency-ms 300 --failure-rate 0.02
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import resource
+import time
+from collections import Counter, defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+os.environ.setdefault("LLM_BACKEND", "template")
+
+from app import runtime
+from app.agents.cs_agents import support_agent
+from app.backends import Completion, TemplateBackend
+from app.llm import llm
+from app.prompts.prompts import CustomerSupportPrompts
+
+ITEMS = ["burger", "fries", "paneer tikka", "2 rotis and dal", "cold coffee", "biryani"]
+RELEVANT_QUERIES = ["where is my order", "my refund is not credited yet", "the delivery partner was rude"]
+OFF_TOPIC_QUERIES = ["tell me a joke", "who won the cricket match", "write a python program"]
+AMBIGUOUS_QUERIES = ["can you help me with something", "what do you think", "hello there"]
+
+class SimulatedFailure(Exception):
+    """Upstream failure raised by SimulatedBackend; a status code of 429 reads as a rate limit"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Simulated upstream failure ({status_code})")
+        self.status_code = status_code
+
+class SimulatedBackend(TemplateBackend):
+    """Template replies delayed by a log-normal latency and failing at a configurable rate"""
+
+    name = "simulated"
+    retryable_errors = (SimulatedFailure,)
+
+    def __init__(self, latency: float, sigma: float, failure_rate: float, rng: random.Random):
+        super().__init__()
+        self.mu = math.log(latency)
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.calls = Counter()
+
+    async def _upstream(self, kind: str):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.rng.lognormvariate(self.mu, self.sigma))
+        if self.rng.random() < self.failure_rate:
+            self.calls["failed"] += 1
+            raise SimulatedFailure(self.rng.choice([429, 503]))
+
+    async def complete(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> Completion:
+        await self._upstream("batch" if options.get("response_format") else "completion")
+        return await super().complete(messages, prompt_key, **options)
+
+    async def stream(self, messages: List[Dict[str, str]], prompt_key: Optional[str] = None, **options) -> AsyncIterator[Completion]:
+        await self._upstream("stream")
+        async for chunk in super().stream(messages, prompt_key, **options):
+            yield chunk
+
+class Population:
+    """Drives simulated customers through the agent's async API and records per-stage latency"""
+
+    def __init__(self, rng: random.Random, think_time: float, stream_share: float):
+        self.rng = rng
+        self.think_time = think_time
+        self.stream_share = stream_share
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.flows = Counter()
+        self.errors = Counter()
+
+    async def _consume(self, result: Dict[str, Any]):
+        stream = result.get("stream")
+        if stream is not None:
+            async for _ in stream:
+                pass
+
+    async def _turn(self, label: str, turn) -> Dict[str, Any]:
+        await asyncio.sleep(self.rng.uniform(0, self.think_time))
+        started = time.perf_counter()
+        result = await turn
+        await self._consume(result)
+        self.latencies[label].append(time.perf_counter() - started)
+
+        if not result.get("success"):
+            self.errors[result.get("error", "unknown")] += 1
+        return result
+
+    async def _say(self, session_id: str, text: str) -> Dict[str, Any]:
+        context = support_agent.sessions.get(session_id)
+        stage = context.stage if context is not None else "missing"
+        stream = self.rng.random() < self.stream_share
+        result = await self._turn(stage, support_agent.aprocess_input(session_id, text, stream=stream))
+
+        if result.get("next_message_pending"):
+            await self._turn("followup", support_agent.acollect_followup(session_id))
+        return result
+
+    async def customer(self, category: str):
+        result = await self._turn("start", support_agent.astart_conversation(category))
+        session_id = result["session_id"]
+        behavior = CustomerSupportPrompts.UI_BEHAVIOR[category]
+        self.flows[category] += 1
+
+        if behavior.get("show_payment_buttons"):
+            option = self.rng.choice(CustomerSupportPrompts.PAYMENT_OPTIONS)
+            stream = self.rng.random() < self.stream_share
+            await self._turn("payment_button", support_agent._ahandle_payment_button(session_id, option, stream=stream))
+            await self._say(session_id, "that did not help, I still have the problem")
+            return
+
+        if not behavior.get("show_input"):
+            return
+
+        await self._say(session_id, self.rng.choice(ITEMS))
+        await self._say(session_id, "photo uploaded")
+        result = await self._say(session_id, "the packaging was torn and it arrived late")
+
+        if result.get("show_buttons"):
+            choice = self.rng.choice(result["buttons"])
+            result = await self._say(session_id, choice)
+            if result.get("resolved"):
+                return
+
+        await self._say(session_id, self.rng.choice(["refund please", "reorder", "yes, please reorder"]))
+
+    async def general_chat(self, category: str):
+        """Free-form questions; no UI flow reaches this stage yet, so the customer is put there directly"""
+        result = await self._turn("start", support_agent.astart_conversation(category))
+        support_agent.sessions.get(result["session_id"]).stage = "general_chat"
+        self.flows["general chat"] += 1
+
+        for queries in (RELEVANT_QUERIES, OFF_TOPIC_QUERIES, AMBIGUOUS_QUERIES):
+            await self._say(result["session_id"], self.rng.choice(queries))
+
+    async def run(self, customers: int, ramp: float, general_chat_share: float):
+        categories = list(CustomerSupportPrompts.CATEGORY_TEMPLATES)
+
+        async def arrive(i: int):
+            await asyncio.sleep(ramp * i / customers)
+            category = self.rng.choice(categories)
+            try:
+                if self.rng.random() < general_chat_share:
+                    await self.general_chat(category)
+                else:
+                    await self.customer(category)
+            except Exception as e:
+                self.errors[type(e).__name__] += 1
+
+        await asyncio.gather(*(arrive(i) for i in range(customers)))
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which customers arrive")
+    parser.add_argument("--think-time", type=float, default=0.2, help="max seconds a customer waits between turns")
+    parser.add_argument("--latency-ms", type=float, default=300, help="median simulated LLM latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal shape of the simulated LLM latency")
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--stream-share", type=float, default=0.3, help="share of turns that stream their reply")
+    parser.add_argument("--general-chat-share", type=float, default=0.1)
+    parser.add_argument("--llm-concurrency", type=int, default=64, help="initial and maximum scheduler concurrency")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    backend = SimulatedBackend(args.latency_ms / 1000, args.sigma, args.failure_rate, rng)
+    llm.backend = backend
+    llm.scheduler.limit = llm.scheduler.max_limit = args.llm_concurrency
+
+    population = Population(rng, args.think_time, args.stream_share)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    runtime.run_sync(population.run(args.customers, args.ramp, args.general_chat_share))
+    elapsed = time.perf_counter() - started
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    turns = sum(len(values) for values in population.latencies.values())
+
+    print(f"{args.customers} customers, {turns} turns in {elapsed:.1f}s: {turns / elapsed:.1f} turns/sec")
+    print(f"simulated LLM: median {args.latency_ms:.0f}ms, sigma {args.sigma}, failure rate {args.failure_rate:.0%}\n")
+
+    print(f"{'stage':<20} {'turns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, values in sorted(population.latencies.items()):
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{stage:<20} {len(values):>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+    print(f"\npeak RSS growth: {(rss_after - rss_before) / 1024:.1f} MiB, "
+          f"sessions held: {len(support_agent.sessions)}, approx session bytes: {support_agent.sessions.approx_memory()}")
+    print(f"upstream calls: {dict(backend.calls)}")
+    print(f"llm outcomes: {llm.stats()}")
+    print(f"scheduler: {llm.scheduler.stats()}")
+    print(f"single flight: {llm.single_flight.stats()}, pool hits/misses: {llm.response_pool.hits}/{llm.response_pool.misses}")
+    print(f"prefetch: {support_agent.prefetcher.stats()}")
+    print(f"degradation: {llm.degradation.stats()}")
+    print(f"flows: {dict(population.flows)}")
+    if population.errors:
+        print(f"errors: {dict(population.errors)}")
+
+if __name__ == "__main__":
+    main()
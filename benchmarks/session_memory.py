@@ -0,0 +1,79 @@
+"""Bytes per session for the legacy dict-based history vs the compact ConversationContext
+
+Run from the repo root:  python -m benchmarks.session_memory --sessions 5000 --turns 6
+"""
+import argparse
+import os
+import tracemalloc
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from app.agents.cs_agents import ConversationContext
+
+CATEGORY = "Item(s) has spillage issue"
+REPLY = "We're sorry about the spillage, we'll share this with the restaurant partner right away."
+
+class LegacyConversationContext:
+    """ConversationContext as it was before the compact representation"""
+
+    def __init__(self, session_id: str, category: str):
+        self.session_id = session_id
+        self.selected_category = category
+        self.stage = "initial"
+        self.collected_items = ""
+        self.conversation_history = []
+        self.payment_option = ""
+
+def fill_legacy(context: LegacyConversationContext, turns: int):
+    for i in range(turns):
+        context.conversation_history.append({"role": "user", "content": f"turn {i}", "timestamp": datetime.now()})
+        context.conversation_history.append({"role": "assistant", "content": REPLY, "timestamp": datetime.now()})
+
+def fill_compact(context: ConversationContext, turns: int):
+    for i in range(turns):
+        context.add_message("user", f"turn {i}")
+        context.add_message("assistant", REPLY)
+
+def measure(build, sessions: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build() for _ in range(sessions)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return total / sessions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--history-limit", type=int, default=8)
+    args = parser.parse_args()
+
+    def legacy():
+        context = LegacyConversationContext(str(uuid.uuid4()), "".join(CATEGORY))
+        fill_legacy(context, args.turns)
+        return context
+
+    def compact(limit=None):
+        context = ConversationContext(str(uuid.uuid4()), "".join(CATEGORY), limit)
+        fill_compact(context, args.turns)
+        return context
+
+    results = {
+        "legacy (dict + datetime)": measure(legacy, args.sessions),
+        "compact": measure(compact, args.sessions),
+        f"compact, history_limit={args.history_limit}": measure(lambda: compact(args.history_limit), args.sessions),
+    }
+
+    baseline = results["legacy (dict + datetime)"]
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    for name, per_session in results.items():
+        print(f"{name:<32} {per_session:>9.0f} bytes/session  ({per_session / baseline:.0%} of legacy)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cold-start cost of the app, split into import time and first-use initialisation
+
+Each run is a fresh interpreter that times, in order: importing app.agents.cs_agents and app.api,
+building the LLM client (get_llm), building the agent (get_support_agent) and, with --warmup,
+opening the upstream connection. --importtime also lists the slowest modules behind the imports.
+
+Run from the repo root:  python -m benchmarks.startup --runs 5 --backend template
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+timings = {}
+
+def stage(name, fn):
+    started = time.perf_counter()
+    fn()
+    timings[name] = time.perf_counter() - started
+
+stage("import app.agents.cs_agents", lambda: __import__("app.agents.cs_agents"))
+stage("import app.api", lambda: __import__("app.api"))
+
+from app.agents.cs_agents import get_support_agent
+from app.llm import get_llm
+
+stage("init get_llm()", get_llm)
+stage("init get_support_agent()", get_support_agent)
+if WARMUP:
+    stage("warmup", get_llm().warmup)
+
+print(json.dumps(timings))
+"""
+
+def run_child(env, warmup: bool):
+    output = subprocess.run([sys.executable, "-c", f"WARMUP = {warmup}\n{CHILD}"], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def slowest_imports(env, count: int):
+    """Modules with the largest cumulative import time, from python -X importtime"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.api"], env=env, check=True,
+                            capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+
+    # Only top-level entries (no indentation) so nested imports are not counted twice
+    top = [(us, name) for us, name in rows if not name.startswith(" ")]
+    return sorted(top, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="template", help="LLM_BACKEND for the runs (groq needs GROQ_API_KEY)")
+    parser.add_argument("--warmup", action="store_true", help="also time opening the upstream connection")
+    parser.add_argument("--importtime", type=int, default=10, help="list this many slowest imports (0 to skip)")
+    args = parser.parse_args()
+
+    env = {**os.environ, "LLM_BACKEND": args.backend, "PYTHONDONTWRITEBYTECODE": "1"}
+    runs = [run_child(env, args.warmup) for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts, LLM_BACKEND={args.backend}\n")
+    print(f"{'stage':<32} {'median ms':>10} {'max ms':>10}")
+    for stage in runs[0]:
+        values = [run[stage] * 1000 for run in runs]
+        print(f"{stage:<32} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+
+    totals = [sum(run.values()) * 1000 for run in runs]
+    print(f"{'total':<32} {statistics.median(totals):>10.1f} {max(totals):>10.1f}")
+
+    if args.importtime:
+        print("\nslowest imports under `import app.api` (cumulative ms):")
+        for us, name in slowest_imports(env, args.importtime):
+            print(f"  {us / 1000:>8.1f}  {name}")
+
+if __name__ == "__main__":
+    main()
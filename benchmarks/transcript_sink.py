@@ -0,0 +1,90 @@
+"""Throughput of the transcript sink and the cost it adds to a turn
+
+Producer threads play conversations turn by turn, calling record() after each turn and end() after
+the last, as the agent does. The run reports the time those calls took on the producer side, the
+end-to-end archive rate in messages/sec, drops under backpressure and the compressed size on disk.
+
+Run from the repo root:  python -m benchmarks.transcript_sink --sessions 20000 --turns 6 --producers 4
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+from app.agents.cs_agents import ConversationContext
+from app.transcripts import SEGMENT_SUFFIX, TranscriptSink
+
+CATEGORIES = ["Item(s) has spillage issue", "Few item(s) are missing in my order", "Item(s) quality is poor"]
+USER = "the packaging was torn and half of the dal had leaked into the bag"
+ASSISTANT = "We're sorry about the spillage, we'll share this with the restaurant partner right away."
+
+def play(sink: TranscriptSink, sessions: int, turns: int, seed: int, timings: list, interval: float):
+    rng = random.Random(seed)
+    for _ in range(sessions):
+        context = ConversationContext(str(uuid.uuid4()), rng.choice(CATEGORIES))
+        for turn in range(turns):
+            context.add_message("user", USER)
+            context.add_message("assistant", ASSISTANT)
+
+            started = time.perf_counter()
+            if turn == turns - 1:
+                sink.end(context, rng.choice(["resolved", "escalated", "abandoned"]))
+            else:
+                sink.record(context)
+            timings.append(time.perf_counter() - started)
+            if interval:
+                time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--producers", type=int, default=4, help="threads playing conversations at once")
+    parser.add_argument("--turn-rate", type=float, default=0, help="turns/sec per producer (0 plays them back to back)")
+    parser.add_argument("--max-queue", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--segment-mb", type=int, default=16)
+    parser.add_argument("--dir", default=None, help="segment directory (a temporary one by default)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="transcripts-")
+    sink = TranscriptSink(directory, max_queue=args.max_queue, batch_size=args.batch_size, flush_interval=0.05,
+                          segment_bytes=args.segment_mb * 1024 * 1024)
+
+    per_producer = args.sessions // args.producers
+    timings = [[] for _ in range(args.producers)]
+    threads = [threading.Thread(target=play, args=(sink, per_producer, args.turns, i, timings[i],
+                                                      1 / args.turn_rate if args.turn_rate else 0))
+               for i in range(args.producers)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    produced = time.perf_counter() - started
+    sink.close()
+    elapsed = time.perf_counter() - started
+
+    calls = sorted(t for producer in timings for t in producer)
+    stats = sink.stats()
+    segments = [name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)]
+    on_disk = sum(os.path.getsize(os.path.join(directory, name)) for name in segments)
+    raw = (len(USER) + len(ASSISTANT)) * per_producer * args.producers * args.turns
+
+    print(f"{per_producer * args.producers} sessions x {args.turns} turns from {args.producers} producers, "
+          f"queue {args.max_queue}, batch {args.batch_size}")
+    print(f"producer side: {len(calls)} calls in {produced:.2f}s, "
+          f"p50 {calls[len(calls) // 2] * 1e6:.1f}us, p99 {calls[int(len(calls) * 0.99)] * 1e6:.1f}us, "
+          f"max {calls[-1] * 1e3:.2f}ms")
+    print(f"archived: {stats['written']} messages in {elapsed:.2f}s = {stats['written'] / elapsed:,.0f} messages/sec "
+          f"(writer busy {stats['write_seconds']:.2f}s, capacity ~{stats['written'] / max(stats['write_seconds'], 1e-9):,.0f} messages/sec)")
+    print(f"dropped under backpressure: {stats['dropped']} messages ({stats['dropped_records']} records)")
+    print(f"segments: {len(segments)} in {directory}, {on_disk / 1024 / 1024:.1f} MiB on disk "
+          f"for {raw / 1024 / 1024:.1f} MiB of message text")
+
+if __name__ == "__main__":
+    main()
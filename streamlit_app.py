@@ -1,7 +1,9 @@
+import os
 import streamlit as st
 import time
 from datetime import datetime
-from app.agents.cs_agents import support_agent
+from streamlit.errors import StreamlitAPIException
+from app.agents.cs_agents import get_support_agent
 
 # Page config
 st.set_page_config(
@@ -103,11 +105,18 @@ header {visibility: hidden;}
 </style>
 """, unsafe_allow_html=True)
 
+# UI_TIMING=1 shows how long each rerun took, to check rerun cost stays flat as chats grow
+SHOW_TIMING = os.getenv("UI_TIMING") == "1"
+
 def init_session_state():
+    if "page" in st.session_state:
+        return
+    
     defaults = {
         "page": "categories",
         "session_id": None,
         "messages": [],
+        "transcript_html": "",
         "show_input": False,
         "show_chat": False,
         "show_buttons": False,
@@ -117,13 +126,12 @@ def init_session_state():
         "escalated": False,
         "resolved": False,
         "next_message": None,
-        "next_message_prompt": None,
-        "next_message_items": None
+        "next_message_pending": False,
+        "notice": None
     }
     
     for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+        st.session_state[key] = value
 
 CATEGORIES = [
     "I did not receive this order",
@@ -147,6 +155,10 @@ def show_categories():
     
     st.markdown("---")
     
+    if st.session_state.notice:
+        st.info(st.session_state.notice)
+        st.session_state.notice = None
+    
     for i, category in enumerate(CATEGORIES):
         if st.button(category, key=f"cat_{i}"):
             start_chat(category)
@@ -157,7 +169,7 @@ def start_chat(category: str):
     st.session_state.resolved = False
     st.session_state.escalated = False
     
-    result = support_agent.start_conversation(category)
+    result = get_support_agent().start_conversation(category)
     
     if result["success"]:
         st.session_state.session_id = result["session_id"]
@@ -168,16 +180,63 @@ def start_chat(category: str):
         st.session_state.payment_buttons = result.get("buttons", [])
         st.session_state.escalated = result.get("needs_escalation", False)
         
-        st.session_state.messages = [
-            {"role": "user", "content": category, "time": datetime.now().strftime("%H:%M")},
-            {"role": "assistant", "content": result["message"], "time": datetime.now().strftime("%H:%M")}
-        ]
+        st.session_state.messages = []
+        st.session_state.transcript_html = ""
+        add_message("user", category)
+        add_message("assistant", result["message"])
         
         st.rerun()
 
+def message_html(role: str, content: str, sent_at: str) -> str:
+    """Chat bubble HTML for one message"""
+    
+    align, bubble = ("right", "user-message") if role == "user" else ("left", "bot-message")
+    return (f'<div style="text-align: {align}; margin-bottom: 15px;"><div class="{bubble}">'
+            f'{content}<div class="message-time">{sent_at}</div></div></div>')
+
+def add_message(role: str, content: str) -> dict:
+    """Append a message to the chat, rendering its bubble once so reruns only re-send the transcript"""
+    
+    sent_at = datetime.now().strftime("%H:%M")
+    msg = {"role": role, "content": content, "time": sent_at, "html": message_html(role, content, sent_at)}
+    st.session_state.messages.append(msg)
+    st.session_state.transcript_html += msg["html"] + "\n"
+    return msg
+
+def render_message(msg: dict):
+    """Render a single chat bubble"""
+    st.markdown(msg["html"], unsafe_allow_html=True)
+
+def rerun_chat():
+    """Rerun only the chat fragment; page changes use a full st.rerun()
+    
+    The fragment also runs as part of full-app runs, where a fragment-scoped rerun is not allowed.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def show_timing(label: str, started: float):
+    if SHOW_TIMING:
+        st.caption(f"{label} rerun: {(time.perf_counter() - started) * 1000:.1f} ms, "
+                   f"{len(st.session_state.messages)} messages")
+
+def stream_reply(result: dict) -> str:
+    """Render a streamed agent reply token by token and return its full text"""
+    
+    stream = result.get("stream")
+    if stream is None:
+        return result["message"]
+    
+    st.write_stream(stream)
+    return stream.text
+
+@st.fragment
 def show_chat():
-    """Show chat interface"""
+    """Show chat interface; reruns after a turn are scoped to this fragment"""
     
+    started = time.perf_counter()
     col1, col2 = st.columns([1, 8])
     with col1:
         if st.button("←", key="back"):
@@ -187,57 +246,25 @@ def show_chat():
     
     st.markdown("---")
     
-    for msg in st.session_state.messages:
-        if msg["role"] == "user":
-            st.markdown(f"""
-            <div style="text-align: right; margin-bottom: 15px;">
-                <div class="user-message">
-                    {msg["content"]}
-                    <div class="message-time">{msg["time"]}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style="text-align: left; margin-bottom: 15px;">
-                <div class="bot-message">
-                    {msg["content"]}
-                    <div class="message-time">{msg["time"]}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+    # Finished bubbles are kept pre-rendered, so the whole transcript is a single element
+    st.markdown(st.session_state.transcript_html, unsafe_allow_html=True)
     
     if st.session_state.next_message:
         time.sleep(1) 
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": st.session_state.next_message,
-            "time": datetime.now().strftime("%H:%M")
-        })
+        add_message("assistant", st.session_state.next_message)
         st.session_state.next_message = None
-        st.rerun()
+        rerun_chat()
     
-    if st.session_state.next_message_prompt and st.session_state.next_message_items:
-        from app.llm import llm
-        from app.prompts.prompts import CustomerSupportPrompts
-        
+    if st.session_state.next_message_pending:
+        # The agent has been generating this message since the previous reply was returned
         time.sleep(1)
-        prompt_key = st.session_state.next_message_prompt
-        items = st.session_state.next_message_items
-        
-        prompts = CustomerSupportPrompts()
-        ai_prompt = prompts.AI_PROMPTS[prompt_key].format(items=items)
-        next_msg = llm.generate_response(ai_prompt)
+        result = get_support_agent().collect_followup(st.session_state.session_id)
         
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": next_msg,
-            "time": datetime.now().strftime("%H:%M")
-        })
+        if result["success"]:
+            add_message("assistant", result["message"])
         
-        st.session_state.next_message_prompt = None
-        st.session_state.next_message_items = None
-        st.rerun()
+        st.session_state.next_message_pending = False
+        rerun_chat()
     
     if st.session_state.escalated:
         st.info(" Chat transferred to support agent")
@@ -270,48 +297,35 @@ def show_chat():
         user_input = st.chat_input("Type your message...")
         if user_input:
             process_input(user_input)
+    
+    show_timing("chat", started)
 
 def process_payment_button(button_text: str):
     """Process payment button click"""
     
-    result = support_agent._handle_payment_button(st.session_state.session_id, button_text)
+    result = get_support_agent()._handle_payment_button(st.session_state.session_id, button_text, stream=True)
     
     if result["success"]:
-        st.session_state.messages.append({
-            "role": "user",
-            "content": button_text,
-            "time": datetime.now().strftime("%H:%M")
-        })
-        
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": result["message"],
-            "time": datetime.now().strftime("%H:%M")
-        })
+        render_message(add_message("user", button_text))
+        add_message("assistant", stream_reply(result))
         
         st.session_state.show_payment_buttons = False
         st.session_state.show_chat = result.get("show_chat", False)
         st.session_state.escalated = result.get("escalated", False)
         
-        st.rerun()
+        rerun_chat()
+    
+    elif result.get("expired"):
+        session_expired()
 
 def process_input(user_input: str):
     """Process user input"""
     
-    result = support_agent.process_input(st.session_state.session_id, user_input)
+    result = get_support_agent().process_input(st.session_state.session_id, user_input, stream=True)
     
     if result["success"]:
-        st.session_state.messages.append({
-            "role": "user",
-            "content": user_input,
-            "time": datetime.now().strftime("%H:%M")
-        })
-        
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": result["message"],
-            "time": datetime.now().strftime("%H:%M")
-        })
+        render_message(add_message("user", user_input))
+        add_message("assistant", stream_reply(result))
         
         st.session_state.show_input = result.get("show_input", False)
         st.session_state.show_chat = result.get("show_chat", False)
@@ -320,10 +334,18 @@ def process_input(user_input: str):
         st.session_state.escalated = result.get("escalated", False)
         st.session_state.resolved = result.get("resolved", False)
         st.session_state.next_message = result.get("next_message", None)
-        st.session_state.next_message_prompt = result.get("next_message_prompt", None)
-        st.session_state.next_message_items = result.get("next_message_items", None)
+        st.session_state.next_message_pending = result.get("next_message_pending", False)
         
-        st.rerun()
+        rerun_chat()
+    
+    elif result.get("expired"):
+        session_expired()
+
+def session_expired():
+    """Send the customer back to the categories page after their session timed out"""
+    st.session_state.notice = "Your chat session expired due to inactivity. Please choose your issue again."
+    st.session_state.session_id = None
+    reset_chat()
 
 def reset_chat():
     """Reset to categories page"""
@@ -332,12 +354,15 @@ def reset_chat():
     st.rerun()
 
 def main():
+    started = time.perf_counter()
     init_session_state()
     
     if st.session_state.page == "categories":
         show_categories()
     else:
         show_chat()
+    
+    show_timing("full", started)
 
 if __name__ == "__main__":
     main()